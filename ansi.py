@@ -0,0 +1,200 @@
+"""
+Play the FSM game in a terminal (e.g. over SSH) instead of an SDL window.
+
+Frames are the same draw console buffers that blit_and_flush() would blit.
+Only the cells that changed since the previous frame are written, the cursor
+is only moved when a run of changed cells is broken, and color escapes are
+only emitted when the color actually changes.
+"""
+import os
+import select
+import sys
+import termios
+import tty
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+import numpy as np
+import tcod
+import tcod.event
+
+from fsm import (
+    CONSOLE_HEIGHT,
+    CONSOLE_WIDTH,
+    STATE_HANDLERS,
+    Backend,
+    State,
+    build_game,
+    run_fsm,
+)
+
+CSI = '\x1b['
+
+# Escape sequences sent by the arrow keys, mapped to scancode and keysym.
+ARROW_KEYS = {
+    b'\x1b[A': (tcod.event.SCANCODE_UP, tcod.event.K_UP),
+    b'\x1b[B': (tcod.event.SCANCODE_DOWN, tcod.event.K_DOWN),
+    b'\x1b[C': (tcod.event.SCANCODE_RIGHT, tcod.event.K_RIGHT),
+    b'\x1b[D': (tcod.event.SCANCODE_LEFT, tcod.event.K_LEFT),
+}
+
+
+def key_event(scancode: int, sym: int, mod: int = 0) -> tcod.event.KeyDown:
+    return tcod.event.KeyDown(scancode=scancode, sym=sym, mod=mod)
+
+
+def parse_keys(data: bytes) -> Iterator[tcod.event.Event]:
+    """Translate raw terminal input into the tcod events the handlers expect."""
+    i = 0
+    while i < len(data):
+        seq = data[i:i + 3]
+        if seq in ARROW_KEYS:
+            scancode, sym = ARROW_KEYS[seq]
+            yield key_event(scancode, sym)
+            i += 3
+            continue
+        byte = data[i]
+        i += 1
+        if byte == 0x03:  # Ctrl-C
+            yield tcod.event.Quit()
+        elif byte == 0x1b:
+            yield key_event(tcod.event.SCANCODE_ESCAPE, tcod.event.K_ESCAPE)
+        elif byte == ord('.'):
+            yield key_event(tcod.event.SCANCODE_PERIOD, tcod.event.K_PERIOD)
+        elif byte == ord('>'):
+            # Shift and the period key on a US layout, as SDL reports it.
+            yield key_event(tcod.event.SCANCODE_PERIOD, tcod.event.K_GREATER, tcod.event.KMOD_LSHIFT)
+        elif ord('a') <= byte <= ord('z') or ord('A') <= byte <= ord('Z'):
+            lower = byte | 0x20
+            mod = 0 if byte == lower else tcod.event.KMOD_LSHIFT
+            yield key_event(tcod.event.SCANCODE_A + lower - ord('a'), lower, mod)
+
+
+def sgr_color(rgb: Tuple[int, int, int], background: bool, truecolor: bool) -> str:
+    r, g, b = rgb
+    base = 48 if background else 38
+    if truecolor:
+        return f'{base};2;{r};{g};{b}'
+    # Quantize to the 6x6x6 cube of the xterm 256 color palette.
+    index = 16 + 36 * round(r / 51) + 6 * round(g / 51) + round(b / 51)
+    return f'{base};5;{index}'
+
+
+class AnsiBackend(Backend):
+
+    def __init__(
+            self,
+            stream: Optional[BinaryIO] = None,
+            input_fd: Optional[int] = None,
+            order: str = 'F',
+            truecolor: bool = True
+    ) -> None:
+        self.stream = stream if stream is not None else sys.stdout.buffer
+        self.input_fd = input_fd if input_fd is not None else sys.stdin.fileno()
+        self.order = order  # the memory order the consoles were created with
+        self.truecolor = truecolor
+        self.bytes_written = 0  # size of the last frame
+        self._ch: Optional[np.ndarray] = None
+        self._fg: Optional[np.ndarray] = None
+        self._bg: Optional[np.ndarray] = None
+        self._cursor: Optional[Tuple[int, int]] = None
+        self._pen: Tuple[Optional[tuple], Optional[tuple]] = (None, None)
+        self._saved_tty: Optional[list] = None
+
+    def __enter__(self) -> 'AnsiBackend':
+        if os.isatty(self.input_fd):
+            self._saved_tty = termios.tcgetattr(self.input_fd)
+            tty.setraw(self.input_fd)
+        self.stream.write(f'{CSI}?1049h{CSI}?25l'.encode())  # alt screen, no cursor
+        self.stream.flush()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stream.write(f'{CSI}0m{CSI}?25h{CSI}?1049l'.encode())
+        self.stream.flush()
+        if self._saved_tty is not None:
+            termios.tcsetattr(self.input_fd, termios.TCSADRAIN, self._saved_tty)
+            self._saved_tty = None
+
+    def present(self, console: tcod.console.Console) -> None:
+        frame = self.render(console)
+        self.bytes_written = len(frame)
+        if frame:
+            self.stream.write(frame)
+            self.stream.flush()
+
+    def wait(self, timeout: Optional[float] = None) -> List[tcod.event.Event]:
+        readable, _, _ = select.select([self.input_fd], [], [], timeout)
+        if not readable:
+            return []
+        return list(parse_keys(os.read(self.input_fd, 1024)))
+
+    def fileno(self) -> Optional[int]:
+        return self.input_fd
+
+    def render(self, console: tcod.console.Console) -> bytes:
+        """Return the escape sequences that turn the last frame into this one."""
+        ch, fg, bg = self._cells(console)
+        out = []
+        if self._ch is None or self._ch.shape != ch.shape:
+            # Nothing on the terminal can be trusted, so repaint everything.
+            out.append(f'{CSI}0m{CSI}2J')
+            self._cursor = None
+            self._pen = (None, None)
+            changed = np.ones(ch.shape, dtype=bool)
+        else:
+            changed = (
+                (ch != self._ch)
+                | (fg != self._fg).any(axis=2)
+                | (bg != self._bg).any(axis=2)
+            )
+        self._ch, self._fg, self._bg = ch.copy(), fg.copy(), bg.copy()
+        ys, xs = np.nonzero(changed)
+        if not len(ys):
+            return b''
+        # Pull the cells out of numpy once rather than per attribute access.
+        chars = ch[ys, xs].tolist()
+        fgs = [tuple(c) for c in fg[ys, xs].tolist()]
+        bgs = [tuple(c) for c in bg[ys, xs].tolist()]
+        pen_fg, pen_bg = self._pen
+        cursor = self._cursor
+        width = ch.shape[1]
+        for y, x, char, cell_fg, cell_bg in zip(ys.tolist(), xs.tolist(), chars, fgs, bgs):
+            if cursor != (x, y):
+                if cursor is not None and cursor[1] == y and cursor[0] < x:
+                    out.append(f'{CSI}{x - cursor[0]}C')
+                else:
+                    out.append(f'{CSI}{y + 1};{x + 1}H')
+            codes = []
+            if cell_fg != pen_fg:
+                codes.append(sgr_color(cell_fg, False, self.truecolor))
+                pen_fg = cell_fg
+            if cell_bg != pen_bg:
+                codes.append(sgr_color(cell_bg, True, self.truecolor))
+                pen_bg = cell_bg
+            if codes:
+                out.append(f'{CSI}{";".join(codes)}m')
+            out.append(chr(char) if char >= 32 else ' ')
+            # Terminals defer wrapping at the last column, so forget the cursor.
+            cursor = (x + 1, y) if x + 1 < width else None
+        self._pen = (pen_fg, pen_bg)
+        self._cursor = cursor
+        return ''.join(out).encode('utf-8')
+
+    def _cells(self, console: tcod.console.Console) -> Tuple[np.ndarray, ...]:
+        # Work in row-major (y, x) order so runs follow the terminal's rows.
+        ch, fg, bg = console.ch, console.fg, console.bg
+        if self.order == 'F':
+            ch, fg, bg = ch.T, fg.swapaxes(0, 1), bg.swapaxes(0, 1)
+        return ch, fg, bg
+
+
+def main():
+    root_console = tcod.console.Console(CONSOLE_WIDTH, CONSOLE_HEIGHT, order='F')
+    draw_console = tcod.console.Console(CONSOLE_WIDTH, CONSOLE_HEIGHT, order='F')
+    with AnsiBackend() as backend:
+        game = build_game(root_console, draw_console, backend=backend)
+        run_fsm(STATE_HANDLERS, State.MAP, game)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+An asyncio flavor of the FSM runner.
+
+Input events are pumped into an asyncio.Queue and AsyncStateHandler.handle()
+awaits that queue instead of blocking in tcod.event.wait(). Anything else that
+should run alongside the game (level pre-generation, autosave, metrics export,
+network spectators) can then be an ordinary task on the same event loop.
+"""
+import asyncio
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple, Type
+
+import tcod
+import tcod.event
+
+from fsm import (
+    CONSOLE_HEIGHT,
+    CONSOLE_WIDTH,
+    EndgameStateHandler,
+    Game,
+    MapStateHandler,
+    State,
+    StateHandler,
+    StateMachine,
+    build_game,
+    open_window,
+    wait_for_events,
+)
+from metrics import MetricsExporter
+
+# How often SDL is polled for input, in seconds. SDL has no file descriptor to
+# wake the event loop with, and its events can only be read on the thread
+# that opened the window, so it is polled: every SDL_POLL_INTERVAL while input
+# is arriving, backing off to SDL_IDLE_POLL_INTERVAL (a frame at 60 Hz, which
+# bounds the extra latency of the first key after a pause) while it isn't.
+SDL_POLL_INTERVAL = 0.001
+SDL_IDLE_POLL_INTERVAL = 1 / 60
+
+BackgroundTask = Callable[['AsyncStateMachine'], Awaitable[None]]
+
+
+class AsyncStateHandler(StateHandler):
+    """Mix in before a StateHandler subclass to make handle() a coroutine."""
+
+    # Set by the runner: (arrival time, event) pairs from the input pump.
+    events: 'asyncio.Queue[Tuple[float, tcod.event.Event]]'
+
+    async def handle(self) -> Tuple[Optional[State], Game]:
+        """
+        Wait for input, then dispatch everything that is queued by now and
+        return the next state and a game instance to use in that state.
+        """
+        if self.game.profiler.active:
+            with self.game.profiler.paused():
+                self.input_at, event = await self.events.get()
+        else:
+            self.input_at, event = await self.events.get()
+        batch = [event]
+        while not self.events.empty():
+            batch.append(self.events.get_nowait()[1])
+        self.dispatch_batch(batch, self.input_at)
+        return self.next_state, self.game
+
+
+class AsyncMapStateHandler(AsyncStateHandler, MapStateHandler):
+    pass
+
+
+class AsyncEndgameStateHandler(AsyncStateHandler, EndgameStateHandler):
+    pass
+
+
+ASYNC_STATE_HANDLERS = {
+    State.MAP: AsyncMapStateHandler,
+    State.ENDGAME: AsyncEndgameStateHandler,
+}
+
+
+class AsyncStateMachine(StateMachine):
+
+    async def run_async(
+            self,
+            state: State,
+            game: Game,
+            metrics: Optional[MetricsExporter] = None,
+            background: Iterable[BackgroundTask] = ()
+    ) -> None:
+        events: asyncio.Queue = asyncio.Queue()
+        handler = self._start(state, game, metrics)
+        for each_handler in self.handlers.values():
+            each_handler.events = events
+        tasks = [asyncio.ensure_future(pump_events(self, events))]
+        tasks.extend(asyncio.ensure_future(task(self)) for task in background)
+        try:
+            while handler is not None:
+                if metrics is not None:
+                    metrics.tick(handler.game)
+                next_state, game = await handler.handle()
+                input_at = handler.input_at
+                handler = self._advance(handler, next_state, game)
+                if game.timings.enabled:
+                    game.timings.record('latency', perf_counter() - input_at)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def pump_events(machine: AsyncStateMachine, events: asyncio.Queue) -> None:
+    """Move input from the backend (or SDL) onto the queue as it arrives."""
+    loop = asyncio.get_running_loop()
+    backend = machine.game.backend
+    fd = backend.fileno() if backend is not None else None
+    readable = asyncio.Event()
+    if fd is not None:
+        loop.add_reader(fd, readable.set)
+    interval = SDL_POLL_INTERVAL
+    try:
+        while True:
+            if fd is not None:
+                await readable.wait()
+                readable.clear()
+            idle = True
+            for event in wait_for_events(machine.game, 0):
+                events.put_nowait((perf_counter(), event))
+                idle = False
+            if fd is None:
+                interval = min(interval * 2, SDL_IDLE_POLL_INTERVAL) if idle else SDL_POLL_INTERVAL
+                await asyncio.sleep(interval)
+    finally:
+        if fd is not None:
+            loop.remove_reader(fd)
+
+
+async def run_fsm_async(
+        state_handlers: Dict[State, Type[AsyncStateHandler]],
+        state: State,
+        game: Game,
+        metrics: Optional[MetricsExporter] = None,
+        background: Iterable[BackgroundTask] = ()
+) -> AsyncStateMachine:
+    machine = AsyncStateMachine(state_handlers)
+    try:
+        await machine.run_async(state, game, metrics, background)
+    finally:
+        if metrics is not None and machine.state is not None:
+            metrics.tick(machine.game, force=True)  # the last, partial interval
+    return machine
+
+
+def run_fsm(
+        state_handlers: Dict[State, Type[AsyncStateHandler]],
+        state: State,
+        game: Game,
+        metrics: Optional[MetricsExporter] = None,
+        background: Iterable[BackgroundTask] = ()
+) -> AsyncStateMachine:
+    """Synchronous entry point: run the async FSM on a fresh event loop."""
+    return asyncio.run(run_fsm_async(state_handlers, state, game, metrics, background))
+
+
+def main():
+    with open_window() as root_console:
+        draw_console = tcod.console.Console(CONSOLE_WIDTH, CONSOLE_HEIGHT, order='F')
+        game = build_game(root_console, draw_console)
+        run_fsm(ASYNC_STATE_HANDLERS, State.MAP, game)
+
+
+if __name__ == '__main__':
+    main()
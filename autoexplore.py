@@ -0,0 +1,243 @@
+"""
+Auto-explore: walk toward the nearest unexplored area until interrupted.
+
+The player follows a Dijkstra map (distance to the nearest frontier tile, i.e.
+remembered floor next to a tile that has never been seen) downhill. As memory
+grows the map is repaired locally instead of being recomputed:
+
+- frontier tiles that are no longer on the frontier are cut out, along with
+  every tile whose distance was only measured through them (one that has no
+  neighbor left that is a step nearer), and
+- newly seen floor, new frontier tiles and the hole that was cut are filled
+  in by a Dijkstra pass seeded from the new frontier and the hole's rim.
+
+Tiles changing (see terrain.py) are repaired the same way. Floor that is
+dug out joins the hole. Floor that is closed off is cut out. Closed doors
+count as floor, since walking into one opens it.
+
+All of it only looks at the chunks of memory that changed and the tiles
+around them, so an update costs the same on a huge level as on a small one.
+What the explorer knows is a copy of the memory, which shares its chunks, so
+beyond the memory itself the explorer keeps 6 bytes per tile.
+"""
+import heapq
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from bitmemory import BitMemory
+from terrain import DOOR
+import travel
+
+UNREACHED = np.iinfo(np.int32).max
+
+NEIGHBORS = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+
+
+def shifted(mask: np.ndarray, dx: int, dy: int) -> np.ndarray:
+    """mask moved by (dx, dy), padding with False."""
+    out = np.zeros_like(mask)
+    height, width = mask.shape
+    out[max(dy, 0):height + min(dy, 0), max(dx, 0):width + min(dx, 0)] = \
+        mask[max(-dy, 0):height + min(-dy, 0), max(-dx, 0):width + min(-dx, 0)]
+    return out
+
+
+def dilate(mask: np.ndarray) -> np.ndarray:
+    out = mask.copy()
+    for dx, dy in NEIGHBORS:
+        out |= shifted(mask, dx, dy)
+    return out
+
+
+def passable(game, box) -> np.ndarray:
+    """The tiles in a box that can be walked on, or opened and then walked on."""
+    return game.fov_map.walkable[box] | (game.tile_codes[box] == DOOR)
+
+
+class Explorer:
+
+    def __init__(self, game) -> None:
+        self.game = game
+        self.reset()
+
+    def reset(self) -> None:
+        """Rebuild the distance map from scratch."""
+        height, width = self.game.memory.shape
+        self.known = BitMemory(height, width)  # memory as of the last update
+        self.floor = np.zeros((height, width), dtype=bool)  # known and passable
+        self.frontier = np.zeros((height, width), dtype=bool)
+        self.distance = np.full((height, width), UNREACHED, dtype=np.int32)
+        self.epoch = -1  # of the memory, as of the last update
+        self.version = self.game.tile_changes.version  # of the tiles, as of the last update
+        self.update()
+
+    def update(self) -> None:
+        """Bring the distance map up to date with the game's memory and tiles."""
+        boxes = self.game.tile_changes.since(self.version)
+        if boxes is None:
+            self.reset()  # too much changed, e.g. a new level
+            return
+        self.version = self.game.tile_changes.version
+        if boxes:
+            self.retile(boxes)
+        memory = self.game.memory
+        # Only the chunks of memory that changed since can hold new tiles.
+        changed = memory.changed_box(self.epoch)
+        self.epoch = memory.epoch
+        if changed is None:
+            return
+        # Frontier status can change up to a tile beyond them, and depends
+        # on the tiles next to those, so look two tiles farther.
+        height, width = memory.shape
+        rows, columns = changed
+        y0, y1 = max(rows.start - 2, 0), min(rows.stop + 2, height)
+        x0, x1 = max(columns.start - 2, 0), min(columns.stop + 2, width)
+        box = np.s_[y0:y1, x0:x1]
+        known = memory[box]
+        new = known & ~self.known[box]
+        self.known = memory.copy()
+        if not new.any():
+            return
+        floor = self.floor[box]
+        floor |= new & passable(self.game, box)
+        region = dilate(new)
+        frontier = floor & dilate(~known) & region
+        was_frontier = self.frontier[box]
+        removed = was_frontier & region & ~frontier
+        added = frontier & ~was_frontier
+        was_frontier &= ~removed
+        was_frontier |= added
+        hole = self._cut([(y0 + int(y), x0 + int(x)) for y, x in zip(*np.nonzero(removed))])
+        hole.extend((y0 + int(y), x0 + int(x)) for y, x in zip(*np.nonzero(new & floor)))
+        queue: List[Tuple[int, int, int]] = []
+        for y, x in zip(*np.nonzero(added)):
+            y, x = y0 + int(y), x0 + int(x)
+            self.distance[y, x] = 0
+            queue.append((0, y, x))
+        self._fill(hole, queue)
+
+    def retile(self, boxes: List[Tuple[int, int, int, int]]) -> None:
+        """Repair the distance map where tiles changed within (x, y, width, height) boxes."""
+        lost, gained = [], []
+        for x, y, width, height in boxes:
+            box = np.s_[y:y + height, x:x + width]
+            floor = self.known[box] & passable(self.game, box)
+            lost.extend((y + int(dy), x + int(dx)) for dy, dx in zip(*np.nonzero(self.floor[box] & ~floor)))
+            gained.extend((y + int(dy), x + int(dx)) for dy, dx in zip(*np.nonzero(floor & ~self.floor[box])))
+            self.floor[box] = floor
+        for y, x in lost:
+            self.frontier[y, x] = False
+        hole = self._cut(lost) + gained
+        # Dug out floor next to the unknown is frontier.
+        height, width = self.floor.shape
+        queue: List[Tuple[int, int, int]] = []
+        for y, x in gained:
+            self.frontier[y, x] = any(
+                0 <= x + dx < width and 0 <= y + dy < height and not self.known[y + dy, x + dx]
+                for dx, dy in NEIGHBORS
+            )
+            if self.frontier[y, x]:
+                self.distance[y, x] = 0
+                queue.append((0, y, x))
+        self._fill(hole, queue)
+
+    def _cut(self, tiles: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """
+        Forget the distances of tiles, and of every tile whose distance was
+        only measured through them. Returns the tiles forgotten.
+        """
+        distance = self.distance
+        height, width = distance.shape
+        cut = []
+        queue = []
+        for y, x in tiles:
+            if distance[y, x] != UNREACHED:
+                queue.append((int(distance[y, x]), y, x))
+                distance[y, x] = UNREACHED
+                cut.append((y, x))
+        # Nearest first, so by the time a tile is checked every nearer one
+        # that was going to be forgotten has been.
+        heapq.heapify(queue)
+        while queue:
+            d, y, x = heapq.heappop(queue)
+            for dx, dy in NEIGHBORS:
+                nx, ny = x + dx, y + dy
+                if (
+                    0 <= nx < width and 0 <= ny < height
+                    and distance[ny, nx] == d + 1 and not self._measured(ny, nx, d)
+                ):
+                    distance[ny, nx] = UNREACHED
+                    cut.append((ny, nx))
+                    heapq.heappush(queue, (d + 1, ny, nx))
+        return cut
+
+    def _measured(self, y: int, x: int, d: int) -> bool:
+        """Whether a neighbor of y, x is still d from the frontier."""
+        height, width = self.distance.shape
+        for dx, dy in NEIGHBORS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < height and self.distance[ny, nx] == d:
+                return True
+        return False
+
+    def _fill(self, hole: List[Tuple[int, int]], queue: List[Tuple[int, int, int]]) -> None:
+        """Fill in the floor in the hole from queue and from the hole's reached rim."""
+        height, width = self.distance.shape
+        in_hole = set(hole)
+        for y, x in in_hole:
+            for dx, dy in NEIGHBORS:
+                nx, ny = x + dx, y + dy
+                if (
+                    0 <= nx < width and 0 <= ny < height
+                    and (ny, nx) not in in_hole and self.distance[ny, nx] != UNREACHED
+                ):
+                    queue.append((int(self.distance[ny, nx]), ny, nx))
+        self._propagate(queue)
+
+    def _propagate(self, queue: List[Tuple[int, int, int]]) -> None:
+        heapq.heapify(queue)
+        distance, floor = self.distance, self.floor
+        height, width = floor.shape
+        while queue:
+            d, y, x = heapq.heappop(queue)
+            if d > distance[y, x]:
+                continue
+            for dx, dy in NEIGHBORS:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < width and 0 <= ny < height and floor[ny, nx]:
+                    if d + 1 < distance[ny, nx]:
+                        distance[ny, nx] = d + 1
+                        heapq.heappush(queue, (d + 1, ny, nx))
+
+    def downhill(self) -> Optional[travel.Step]:
+        """The step toward the nearest frontier, avoiding mobs, if any."""
+        game = self.game
+        best = self.distance[game.player_y, game.player_x]
+        step = None
+        for dx, dy in NEIGHBORS:
+            x, y = game.player_x + dx, game.player_y + dy
+            if not (0 <= x < game.map_width and 0 <= y < game.map_height):
+                continue
+            if self.distance[y, x] < best and (x, y) not in game.mobs:
+                best = self.distance[y, x]
+                step = dx, dy
+        return step
+
+
+def explore(handler, explorer: Explorer, animate_every: Optional[float] = None) -> str:
+    game = handler.game
+    exit_known = game.memory[game.exit_y, game.exit_x]
+
+    def next_step() -> Optional[travel.Step]:
+        explorer.update()
+        if not exit_known and game.memory[game.exit_y, game.exit_x]:
+            game.messages.append('You see the exit.')
+            return None
+        return explorer.downhill()
+
+    explorer.update()
+    if not explorer.frontier.any():
+        game.messages.append('There is nothing left to explore.')
+        return 'explored'
+    return travel.auto_move(handler, next_step, animate_every)
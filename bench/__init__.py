@@ -0,0 +1,18 @@
+"""
+Benchmarks spanning the game's progression, from level1_winning through
+level7_memory, fsm.py and the older pmrl.py.
+
+Every variant runs the same operations (build_map, build_game, one turn of
+maybe_move, compute_fov and draw_map, where the variant has them) headlessly
+at fixed seeds and map sizes, so results show what each feature layer costs.
+
+    python -m bench run --out results.json
+    python -m bench compare baseline.json results.json
+
+bench.persistence times saving and loading fsm.py games at 80x50 and 2000x2000:
+
+    python -m bench persistence
+"""
+from bench.persistence import format_persistence, run_persistence_benchmarks
+from bench.runner import compare, format_results, run_benchmarks
+from bench.variants import OPERATIONS, VARIANTS
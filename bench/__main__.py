@@ -0,0 +1,50 @@
+import argparse
+import json
+import sys
+
+from bench.persistence import format_persistence, run_persistence_benchmarks
+from bench.runner import compare, format_results, run_benchmarks
+from bench.variants import OPERATIONS, VARIANTS
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Benchmark the game variants.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('--out', help='write results to this JSON file')
+    run_parser.add_argument('--variants', nargs='+', choices=VARIANTS, default=VARIANTS)
+    run_parser.add_argument('--operations', nargs='+', choices=list(OPERATIONS), default=list(OPERATIONS))
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--min-time', type=float, default=0.05, help='seconds per timing loop')
+    run_parser.add_argument('--repeat', type=int, default=5)
+    compare_parser = subparsers.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='slowdown, as a fraction, that counts as a regression')
+    persistence_parser = subparsers.add_parser('persistence', help='time saving and loading fsm games')
+    persistence_parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if args.command == 'persistence':
+        print('\n'.join(format_persistence(run_persistence_benchmarks(seed=args.seed))))
+        return
+    if args.command == 'run':
+        report = run_benchmarks(args.variants, args.operations, args.seed, args.min_time, args.repeat)
+        print('\n'.join(format_results(report)))
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(report, f, indent=2)
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    lines, regressions = compare(baseline, current, args.threshold)
+    print('\n'.join(lines))
+    if regressions:
+        print(f'{len(regressions)} regression(s): {", ".join(regressions)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
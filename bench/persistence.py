@@ -0,0 +1,93 @@
+"""
+Save and load timings for fsm.py games at a few map sizes, and what the
+turn journal costs in comparison.
+"""
+import os
+import statistics
+import tempfile
+from time import perf_counter
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+import tcod
+
+from bench.runner import measure
+from bots import RandomPolicy
+from config import GameConfig
+import fsm
+from journal import Journal
+import savegame
+
+# The classic map and a huge one, set up like stress.py's.
+SIZES = [
+    GameConfig(map_width=80, map_height=50),
+    GameConfig(map_width=2000, map_height=2000, mobs=50_000, walk_length=2_000_000, ai_radius=64),
+]
+
+
+def run_persistence_benchmarks(
+        sizes: Iterable[GameConfig] = SIZES,
+        seed: int = 1,
+        min_time: float = 0.05,
+        repeat: int = 5
+) -> Dict[str, Dict[str, Any]]:
+    results = {}
+    console = tcod.console.Console(fsm.CONSOLE_WIDTH, fsm.CONSOLE_HEIGHT, order='F')
+    with tempfile.TemporaryDirectory() as directory:
+        for config in sizes:
+            width, height = config.map_width, config.map_height
+            game = fsm.build_game(console, console, seed=seed, config=config)
+            path = os.path.join(directory, f'{width}x{height}.pmsv')
+            results[f'{width}x{height}'] = {
+                'save': measure(lambda: savegame.save_game(game, path), min_time, repeat),
+                'load': measure(lambda: fsm.load_game(path, console, console), min_time, repeat),
+                'bytes': os.path.getsize(path),
+            }
+            results[f'{width}x{height}'].update(
+                journal_cost(console, seed, config, os.path.join(directory, f'{width}x{height}'))
+            )
+    return results
+
+
+def journal_cost(
+        console: tcod.console.Console,
+        seed: int,
+        config: GameConfig,
+        directory: str,
+        turns: int = 20
+) -> Dict[str, float]:
+    """Bytes written and time spent appending per turn while a bot wanders."""
+    journal = Journal(directory, compact_every=turns + 1)
+    game = fsm.build_game(console, console, seed=seed, config=config, journal=journal)
+    handler = fsm.MapStateHandler(fsm.State.MAP, game)
+    policy = RandomPolicy(game, np.random.default_rng(seed))
+    handler.maybe_move(*policy.choose())  # the first commit starts the segment
+    commit_seconds = []
+    commit = journal.commit
+
+    def timed_commit(game):
+        started = perf_counter()
+        commit(game)
+        commit_seconds.append(perf_counter() - started)
+    journal.commit = timed_commit
+    while len(commit_seconds) < turns and handler.next_state == fsm.State.MAP:
+        handler.maybe_move(*policy.choose())
+    journal.close()
+    return {
+        'journal_bytes_per_turn': journal.bytes_written / max(1, len(commit_seconds)),
+        'journal_us_per_turn': statistics.median(commit_seconds) * 1e6 if commit_seconds else 0.0,
+    }
+
+
+def format_persistence(results: Dict[str, Dict[str, Any]]) -> List[str]:
+    lines = [
+        f'{"map":<12}{"save ms":>10}{"load ms":>10}{"size KiB":>11}'
+        f'{"journal B/turn":>16}{"journal us/turn":>17}'
+    ]
+    for size, stats in results.items():
+        lines.append(
+            f'{size:<12}{stats["save"]["median_us"] / 1000:10.2f}'
+            f'{stats["load"]["median_us"] / 1000:10.2f}{stats["bytes"] / 1024:11.1f}'
+            f'{stats["journal_bytes_per_turn"]:16.0f}{stats["journal_us_per_turn"]:17.1f}'
+        )
+    return lines
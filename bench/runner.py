@@ -0,0 +1,112 @@
+import importlib
+import platform
+import statistics
+import time
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import tcod
+
+from bench.variants import OPERATIONS, VARIANTS
+from config import GameConfig
+
+
+def measure(fn: Callable[[], object], min_time: float, repeat: int) -> Dict[str, float]:
+    """
+    Time fn like timeit: calibrate a loop count that runs for at least
+    min_time, then take the best and median of repeat loops, per call.
+    """
+    fn()  # warm up
+    number = 1
+    while True:
+        started = perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number *= 2
+    per_call = []
+    for _ in range(repeat):
+        started = perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((perf_counter() - started) / number)
+    return {
+        'best_us': min(per_call) * 1e6,
+        'median_us': statistics.median(per_call) * 1e6,
+        'loops': number,
+    }
+
+
+def run_benchmarks(
+        variants: Iterable[str] = VARIANTS,
+        operations: Iterable[str] = OPERATIONS,
+        seed: int = 1,
+        min_time: float = 0.05,
+        repeat: int = 5,
+        config: Optional[GameConfig] = None
+) -> Dict[str, Any]:
+    operations = list(operations)
+    results: Dict[str, Dict[str, Any]] = {}
+    for variant in variants:
+        module = importlib.import_module(variant)
+        results[variant] = {}
+        for operation in operations:
+            fn = OPERATIONS[operation](module, seed, config)
+            if fn is not None:
+                results[variant][operation] = measure(fn, min_time, repeat)
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'tcod': tcod.__version__,
+            'machine': platform.machine(),
+            'seed': seed,
+            'config': config.to_dict() if config is not None else None,
+        },
+        'results': results,
+    }
+
+
+def format_results(report: Dict[str, Any]) -> List[str]:
+    results = report['results']
+    operations = [op for op in OPERATIONS if any(op in ops for ops in results.values())]
+    lines = ['median us per call'.ljust(18) + ''.join(f'{op:>13}' for op in operations)]
+    for variant, ops in results.items():
+        cells = ''.join(
+            f'{ops[op]["median_us"]:13.1f}' if op in ops else f'{"-":>13}'
+            for op in operations
+        )
+        lines.append(f'{variant:<18}{cells}')
+    return lines
+
+
+def compare(
+        baseline: Dict[str, Any],
+        current: Dict[str, Any],
+        threshold: float = 0.1
+) -> Tuple[List[str], List[str]]:
+    """
+    Compare two runs' medians. Returns report lines and the regressions,
+    i.e. operations more than threshold (a fraction) slower than baseline.
+    """
+    lines = [f'{"variant":<18}{"operation":<13}{"baseline":>11}{"current":>11}{"change":>9}']
+    regressions = []
+    for variant, ops in current['results'].items():
+        for operation, stats in ops.items():
+            base = baseline['results'].get(variant, {}).get(operation)
+            if base is None:
+                continue
+            change = stats['median_us'] / base['median_us'] - 1
+            flag = ''
+            if change > threshold:
+                flag = '  REGRESSION'
+                regressions.append(f'{variant} {operation}')
+            lines.append(
+                f'{variant:<18}{operation:<13}{base["median_us"]:11.1f}'
+                f'{stats["median_us"]:11.1f}{change:+9.1%}{flag}'
+            )
+    return lines, regressions
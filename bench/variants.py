@@ -0,0 +1,151 @@
+"""
+Adapters that set up each benchmarked operation for each variant.
+
+An operation's setup function does any untimed preparation and returns a
+zero-argument callable to time, or None if the variant can't do that
+operation (e.g. there is no FOV before level6_fov). A GameConfig only
+applies to variants whose build_game takes one; the rest keep their own sizes.
+"""
+from inspect import signature
+from itertools import cycle
+import random
+from types import ModuleType
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import tcod
+
+from config import GameConfig
+
+# Module names, in the order the features were added.
+VARIANTS = [
+    'level1_winning',
+    'level2_movement',
+    'level3_mapgen',
+    'level4_mobs',
+    'level5_combat',
+    'level6_fov',
+    'level7_memory',
+    'fsm',
+    'pmrl',
+]
+
+MAP_WIDTH = 80
+MAP_HEIGHT = 50
+FOV_RADIUS = 10
+
+Setup = Callable[[ModuleType, int, Optional[GameConfig]], Optional[Callable[[], object]]]
+
+
+def new_consoles(width: int = 80, height: int = 50):
+    return (
+        tcod.console.Console(width, height, order='F'),
+        tcod.console.Console(width, height, order='F'),
+    )
+
+
+def game_options(module: ModuleType, seed: int, config: Optional[GameConfig]):
+    """The keyword arguments module.build_game() accepts."""
+    parameters = signature(module.build_game).parameters
+    options = {}
+    if 'seed' in parameters:
+        options['seed'] = seed
+    if 'config' in parameters:
+        options['config'] = config
+    return options
+
+
+def new_game(module: ModuleType, seed: int, config: Optional[GameConfig]):
+    random.seed(seed)
+    root_console, draw_console = new_consoles()
+    return module.build_game(root_console, draw_console, **game_options(module, seed, config))
+
+
+def setup_build_map(module: ModuleType, seed: int, config: Optional[GameConfig]):
+    if hasattr(module, 'generate_map'):
+        # pmrl.py sizes its map from module constants.
+        def build():
+            random.seed(seed)
+            return module.generate_map()
+        return build
+    if not hasattr(module, 'build_map'):
+        return None
+    parameters = signature(module.build_map).parameters
+    if config is not None and 'walk_length' in parameters:
+        return lambda: module.build_map(
+            config.map_width,
+            config.map_height,
+            np.random.default_rng(seed),
+            config.walk_steps
+        )
+    if 'rng' in parameters:
+        return lambda: module.build_map(MAP_WIDTH, MAP_HEIGHT, np.random.default_rng(seed))
+
+    def build():
+        random.seed(seed)
+        return module.build_map(MAP_WIDTH, MAP_HEIGHT)
+    return build
+
+
+def setup_build_game(module: ModuleType, seed: int, config: Optional[GameConfig]):
+    if not hasattr(module, 'build_game'):
+        return None
+    root_console, draw_console = new_consoles()
+    options = game_options(module, seed, config)
+
+    def build():
+        random.seed(seed)
+        return module.build_game(root_console, draw_console, **options)
+    return build
+
+
+def setup_turn(module: ModuleType, seed: int, config: Optional[GameConfig]):
+    handler_class = getattr(module, 'MapStateHandler', None)
+    if handler_class is None or not hasattr(handler_class, 'handle_move'):
+        return None
+    game = new_game(module, seed, config)
+    handler = handler_class(module.State.MAP, game)
+    # level2_movement has no maybe_move yet, just moving.
+    move = getattr(handler, 'maybe_move', handler.handle_move)
+    directions = cycle([(1, 0), (0, 1), (-1, 0), (0, -1)])
+    return lambda: move(*next(directions))
+
+
+def setup_compute_fov(module: ModuleType, seed: int, config: Optional[GameConfig]):
+    if not hasattr(module, 'build_game'):
+        return None
+    game = new_game(module, seed, config)
+    if not hasattr(game, 'fov_map'):
+        return None
+    if hasattr(module, 'compute_fov'):
+        return lambda: module.compute_fov(game)  # only the window around the player
+    radius = config.fov_radius if config is not None else FOV_RADIUS
+    return lambda: game.fov_map.compute_fov(game.player_x, game.player_y, radius)
+
+
+def setup_draw_map(module: ModuleType, seed: int, config: Optional[GameConfig]):
+    if hasattr(module, 'generate_map'):
+        random.seed(seed)
+        map_tiles = module.generate_map()
+        occupied_coords = []
+        exit_coords = module.choose_random_open_tile(map_tiles, occupied_coords)
+        mobs_coords = [
+            module.choose_random_open_tile(map_tiles, occupied_coords)
+            for i in range(40)
+        ]
+        player_coords = module.choose_random_open_tile(map_tiles, occupied_coords)
+        console, _ = new_consoles()
+        return lambda: module.draw_map(console, map_tiles, exit_coords, player_coords, mobs_coords)
+    if not hasattr(module, 'draw_map'):
+        return None
+    game = new_game(module, seed, config)
+    return lambda: module.draw_map(game)
+
+
+OPERATIONS: Dict[str, Setup] = {
+    'build_map': setup_build_map,
+    'build_game': setup_build_game,
+    'turn': setup_turn,
+    'compute_fov': setup_compute_fov,
+    'draw_map': setup_draw_map,
+}
@@ -0,0 +1,142 @@
+"""
+The player's memory of the map, one bit per tile.
+
+The map is split into CHUNK x CHUNK chunks, each packed 8 tiles to a byte
+along x. Chunks the player has seen nothing of aren't stored at all, so a
+huge level that is mostly unexplored takes next to no memory, and even a
+fully explored one takes an eighth of a bool array.
+
+Reads and writes go through windows: the FOV's bounding box is OR-ed in and
+the viewport unpacked, touching only the few chunks under them. Chunks are
+never changed in place but replaced, so a copy, or a history of the chunks
+a turn replaced, shares everything else.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+CHUNK = 128
+
+Key = Tuple[int, int]  # chunk row, chunk column
+
+
+class BitMemory:
+
+    def __init__(self, height: int, width: int) -> None:
+        self.shape = height, width
+        self.chunks: Dict[Key, np.ndarray] = {}  # (CHUNK, CHUNK // 8) uint8 each
+        self.epoch = 0  # bumped by every change
+        self.changed: Dict[Key, int] = {}  # the epoch each chunk last changed in
+
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> 'BitMemory':
+        """Pack a boolean array indexed [y, x]."""
+        height, width = array.shape
+        memory = cls(height, width)
+        rows, columns = -(-height // CHUNK), -(-width // CHUNK)
+        padded = np.zeros((rows * CHUNK, columns * CHUNK), dtype=bool)
+        padded[:height, :width] = array
+        packed = np.packbits(padded, axis=1).reshape(rows, CHUNK, columns, CHUNK // 8)
+        for row, column in zip(*np.nonzero(packed.any(axis=(1, 3)))):
+            key = int(row), int(column)
+            memory.chunks[key] = packed[row, :, column].copy()
+            memory.changed[key] = 0
+        return memory
+
+    @property
+    def nbytes(self) -> int:
+        return sum(chunk.nbytes for chunk in self.chunks.values())
+
+    def copy(self) -> 'BitMemory':
+        memory = BitMemory(*self.shape)
+        memory.chunks = dict(self.chunks)
+        return memory
+
+    def __getitem__(self, index):
+        """memory[y, x] is a bool, memory[y0:y1, x0:x1] an unpacked window."""
+        y, x = index
+        if isinstance(y, slice) and isinstance(x, slice):
+            height, width = self.shape
+            y0, y1, _ = y.indices(height)
+            x0, x1, _ = x.indices(width)
+            return self.window(x0, y0, x1 - x0, y1 - y0)
+        chunk = self.chunks.get((y // CHUNK, x // CHUNK))
+        if chunk is None:
+            return False
+        return bool(chunk[y % CHUNK, x % CHUNK >> 3] >> (7 - x % 8) & 1)
+
+    def window(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        """Unpack the tiles in a box to a boolean array indexed [y, x]."""
+        out = np.zeros((max(height, 0), max(width, 0)), dtype=bool)
+        for key, (chunk_box, out_box) in self._overlaps(x, y, width, height):
+            chunk = self.chunks.get(key)
+            if chunk is not None:
+                out[out_box] = np.unpackbits(chunk, axis=1)[chunk_box]
+        return out
+
+    def or_in(self, x: int, y: int, seen: np.ndarray) -> None:
+        """Remember the tiles set in seen, a boolean window at x, y."""
+        height, width = seen.shape
+        self.epoch += 1
+        for key, (chunk_box, seen_box) in self._overlaps(x, y, width, height):
+            part = seen[seen_box]
+            if not part.any():
+                continue
+            # Pack the rows seen, lined up with the chunk's bytes, and OR them in.
+            rows, columns = chunk_box
+            lines = np.zeros((part.shape[0], CHUNK), dtype=bool)
+            lines[:, columns] = part
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                chunk = np.zeros((CHUNK, CHUNK // 8), dtype=np.uint8)
+            old = chunk[rows]
+            new = old | np.packbits(lines, axis=1)
+            if np.array_equal(new, old):
+                continue  # nothing new
+            chunk = chunk.copy()
+            chunk[rows] = new
+            self.chunks[key] = chunk
+            self.changed[key] = self.epoch
+
+    def to_array(self) -> np.ndarray:
+        """Unpack the whole map, e.g. for saving."""
+        height, width = self.shape
+        return self.window(0, 0, width, height)
+
+    def keys(self, x: int, y: int, width: int, height: int) -> List[Key]:
+        """The chunks a box overlaps."""
+        return [key for key, _ in self._overlaps(x, y, width, height)]
+
+    def replace(self, key: Key, chunk: Optional[np.ndarray]) -> None:
+        """Put back a chunk, or None for none, e.g. when rewinding."""
+        self.epoch += 1
+        if chunk is None:
+            self.chunks.pop(key, None)
+        else:
+            self.chunks[key] = chunk
+        self.changed[key] = self.epoch
+
+    def changed_box(self, since: int) -> Optional[Tuple[slice, slice]]:
+        """The [y, x] slices around every chunk changed after epoch since."""
+        keys = [key for key, epoch in self.changed.items() if epoch > since]
+        if not keys:
+            return None
+        rows, columns = zip(*keys)
+        return (
+            np.s_[min(rows) * CHUNK:(max(rows) + 1) * CHUNK],
+            np.s_[min(columns) * CHUNK:(max(columns) + 1) * CHUNK],
+        )
+
+    def _overlaps(self, x: int, y: int, width: int, height: int):
+        """(key, (slices into the chunk, slices into the box)) for each chunk under a box."""
+        map_height, map_width = self.shape
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, map_width), min(y + height, map_height)
+        for row in range(y0 // CHUNK, (y1 - 1) // CHUNK + 1 if y1 > y0 else 0):
+            top, bottom = max(y0, row * CHUNK), min(y1, (row + 1) * CHUNK)
+            for column in range(x0 // CHUNK, (x1 - 1) // CHUNK + 1 if x1 > x0 else 0):
+                left, right = max(x0, column * CHUNK), min(x1, (column + 1) * CHUNK)
+                yield (row, column), (
+                    np.s_[top - row * CHUNK:bottom - row * CHUNK, left - column * CHUNK:right - column * CHUNK],
+                    np.s_[top - y:bottom - y, left - x:right - x],
+                )
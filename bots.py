@@ -0,0 +1,246 @@
+"""
+Bots that play the FSM game headlessly, and a harness that plays many games
+across a process pool to load-test the engine.
+
+    python bots.py --games 1000 --policy explorer --processes 8
+"""
+import argparse
+import json
+import multiprocessing
+import os
+from time import perf_counter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import tcod
+
+import autoexplore
+from config import GameConfig
+from fsm import (
+    CONSOLE_HEIGHT,
+    CONSOLE_WIDTH,
+    Game,
+    HeadlessBackend,
+    MapStateHandler,
+    State,
+    build_game,
+)
+from metrics import MetricsExporter, add_metrics_arguments, metrics_from_args, peak_rss_bytes
+from profiler import Profiler
+from timing import Timings
+import travel
+
+DIRECTIONS = travel.DIRECTIONS
+
+
+class Policy:
+    """Chooses the player's next move. Moves into mobs attack them."""
+
+    def __init__(self, game: Game, rng: np.random.Generator) -> None:
+        self.game = game
+        self.rng = rng
+
+    def choose(self) -> travel.Step:
+        raise NotImplementedError()
+
+    def random_step(self) -> travel.Step:
+        return DIRECTIONS[self.rng.integers(len(DIRECTIONS))]
+
+
+class RandomPolicy(Policy):
+
+    def choose(self) -> travel.Step:
+        return self.random_step()
+
+
+class GreedyExitPolicy(Policy):
+    """Head straight for the exit, wandering when no move gets closer."""
+
+    def choose(self) -> travel.Step:
+        game = self.game
+        walkable = game.fov_map.walkable
+        best = abs(game.exit_x - game.player_x) + abs(game.exit_y - game.player_y)
+        closer = []
+        for dx, dy in DIRECTIONS:
+            x, y = game.player_x + dx, game.player_y + dy
+            if 0 <= x < game.map_width and 0 <= y < game.map_height and walkable[y, x]:
+                if abs(game.exit_x - x) + abs(game.exit_y - y) < best:
+                    closer.append((dx, dy))
+        if closer:
+            return closer[self.rng.integers(len(closer))]
+        return self.random_step()
+
+
+class ExplorerPolicy(Policy):
+    """Explore like the auto-explore command until the exit is seen, then go."""
+
+    def __init__(self, game: Game, rng: np.random.Generator) -> None:
+        super().__init__(game, rng)
+        self.explorer = autoexplore.Explorer(game)
+        self.level = game.level
+
+    def choose(self) -> travel.Step:
+        game = self.game
+        if game.level != self.level:
+            self.explorer = autoexplore.Explorer(game)
+            self.level = game.level
+        if game.memory[game.exit_y, game.exit_x]:
+            path = travel.find_path(game, game.exit_x, game.exit_y)
+            if path and len(path) > 1:
+                x, y = path[1]
+                return x - game.player_x, y - game.player_y
+        self.explorer.update()
+        return self.explorer.downhill() or self.random_step()
+
+
+POLICIES = {
+    'random': RandomPolicy,
+    'greedy': GreedyExitPolicy,
+    'explorer': ExplorerPolicy,
+}
+
+
+def play_game(
+        policy_name: str,
+        seed: Optional[int],
+        max_steps: int,
+        config: Optional[GameConfig] = None,
+        profiler: Optional[Profiler] = None,
+        metrics: Optional[MetricsExporter] = None
+) -> Dict[str, Any]:
+    """Play one game to the end or max_steps moves; return its stats."""
+    console = tcod.console.Console(CONSOLE_WIDTH, CONSOLE_HEIGHT, order='F')
+    timings = Timings(window=max_steps)
+    timings.collect()
+    game = build_game(
+        console,
+        console,
+        backend=HeadlessBackend(),
+        timings=timings,
+        seed=seed,
+        config=config,
+        profiler=profiler
+    )
+    handler = MapStateHandler(State.MAP, game)
+    policy = POLICIES[policy_name](game, np.random.default_rng(seed))
+    started = perf_counter()
+    steps = 0
+    while handler.next_state == State.MAP and steps < max_steps:
+        handler.maybe_move(*policy.choose())
+        steps += 1
+        if game.profiler.active:
+            game.profiler.tick(game.turns)
+        if metrics is not None:
+            metrics.tick(game)
+    elapsed = perf_counter() - started
+    if metrics is not None:
+        metrics.tick(game, force=True)
+    profiles = game.profiler.stop()
+    if game.dungeon is not None:
+        game.dungeon.close()
+    phases = {}
+    for phase, samples in timings.samples.items():
+        phases[phase] = [len(samples), sum(samples), max(samples)]
+    return {
+        'seed': game.rng.seed,
+        'turns': game.turns,
+        'won': bool(game.won),
+        'seconds': elapsed,
+        'phases': phases,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'profiles': profiles,
+    }
+
+
+def _play_game(args) -> Dict[str, Any]:
+    return play_game(*args)
+
+
+def soak(
+        games: int,
+        policy_name: str,
+        processes: Optional[int] = None,
+        max_steps: int = 2000,
+        seed: int = 0,
+        metrics: Optional[MetricsExporter] = None
+) -> Dict[str, Any]:
+    """
+    Play games in parallel and aggregate their stats. With metrics, the
+    turns played so far and each finished game's mean phase times are
+    exported as the games come in.
+    """
+    processes = processes or os.cpu_count() or 1
+    jobs = [(policy_name, seed + i, max_steps) for i in range(games)]
+    # Small chunks keep every worker busy until the end; fewer, larger ones
+    # keep pickling overhead down.
+    chunksize = max(1, games // (processes * 8))
+    started = perf_counter()
+    results: List[Dict[str, Any]] = []
+    timings = Timings()
+    timings.collect()
+    with multiprocessing.Pool(processes) as pool:
+        for result in pool.imap_unordered(_play_game, jobs, chunksize):
+            results.append(result)
+            if metrics is not None:
+                for phase, (count, total, _) in result['phases'].items():
+                    timings.record(phase, total / count)
+                metrics.tick_totals(
+                    sum(each['turns'] for each in results),
+                    timings,
+                    force=len(results) == games,
+                    games=len(results),
+                    wins=sum(each['won'] for each in results)
+                )
+    elapsed = perf_counter() - started
+    phases: Dict[str, List[float]] = {}
+    for result in results:
+        for phase, (count, total, worst) in result['phases'].items():
+            calls, seconds, slowest = phases.get(phase, (0, 0.0, 0.0))
+            phases[phase] = [calls + count, seconds + total, max(slowest, worst)]
+    turns = sum(result['turns'] for result in results)
+    return {
+        'games': games,
+        'policy': policy_name,
+        'processes': processes,
+        'seconds': elapsed,
+        'turns': turns,
+        'turns_per_second': turns / elapsed,
+        'win_rate': sum(result['won'] for result in results) / games,
+        'phases': {
+            phase: {'calls': calls, 'mean_ms': seconds / calls * 1000, 'max_ms': slowest * 1000}
+            for phase, (calls, seconds, slowest) in phases.items()
+        },
+        'peak_rss_bytes': max(result['peak_rss_bytes'] for result in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play many headless games with a bot.')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='explorer')
+    parser.add_argument('--processes', type=int, help='defaults to the number of CPUs')
+    parser.add_argument('--max-steps', type=int, default=2000, help='moves per game before giving up')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    metrics = metrics_from_args(args)
+    try:
+        report = soak(args.games, args.policy, args.processes, args.max_steps, args.seed, metrics)
+    finally:
+        if metrics is not None:
+            metrics.close()
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f'{report["games"]} games ({report["policy"]}) on {report["processes"]} processes '
+          f'in {report["seconds"]:.2f}s')
+    print(f'{report["turns_per_second"]:.0f} turns/s, win rate {report["win_rate"]:.1%}, '
+          f'peak RSS {report["peak_rss_bytes"] / 2 ** 20:.1f} MiB')
+    for phase, stats in report['phases'].items():
+        print(f'  {phase:<12} {stats["calls"]:>9} calls  '
+              f'mean {stats["mean_ms"]:.3f} ms  max {stats["max_ms"]:.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
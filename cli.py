@@ -0,0 +1,260 @@
+"""
+One entry point for every variant of the game.
+
+    python cli.py                                   # fsm.py in an SDL window
+    python cli.py --renderer ansi --seed 42 --map-size 200x100 --mobs 400
+    python cli.py --renderer headless --bot explorer --turns 1000
+    python cli.py --replay session.pmrl
+    python cli.py --load savegame.pmsv
+    python cli.py --autosave-every 100 --load autosaves
+    python cli.py --journal journal; python cli.py --recover journal
+    python cli.py --history 500
+    python cli.py --levels 10 --level-cache 3
+    python cli.py --doors 20
+    python cli.py --tick-rate 2
+    python cli.py --bench --map-size 1000x1000
+    python cli.py level6_fov --profile level6.pstats
+    python cli.py --profile-turns 50 --profiler sampling
+    python cli.py --metrics-jsonl metrics.jsonl --metrics-prom pmrl.prom
+
+While playing fsm or async_fsm, P starts or stops profiling the next turns
+(--profile-turns, 100 by default) into --profile-dir. With --history, U
+undoes the last turn, even after losing. With --levels, > on the entrance
+of a level goes back to the one before. D and then a direction digs through
+a wall; C and then a direction closes a door. With --tick-rate, the mobs
+take a turn that many times a second while the player waits.
+
+Only fsm and async_fsm take game options. The older variants have their own
+hard-wired main(), so they can only be profiled or benchmarked.
+"""
+import argparse
+import cProfile
+from functools import partial
+import importlib
+import os
+from typing import Callable, Optional
+
+import tcod
+
+from autosave import Autosaver, latest_autosave
+from bench import format_results, run_benchmarks
+from bots import POLICIES, play_game
+from config import GameConfig, add_config_arguments, config_from_args
+from dungeon import Dungeon
+from fsm import Game, build_game, load_game, recover_game
+from history import History
+from journal import Journal
+from metrics import MetricsExporter, add_metrics_arguments, metrics_from_args
+from profiler import MODES, Profiler
+import replay
+
+GAME_VARIANTS = ['fsm', 'async_fsm']
+LEGACY_VARIANTS = [
+    'level0_simple_fsm',
+    'level1_winning',
+    'level2_movement',
+    'level3_mapgen',
+    'level4_mobs',
+    'level5_combat',
+    'level6_fov',
+    'level7_memory',
+    'pmrl',
+]
+RENDERERS = ['sdl', 'headless', 'ansi']
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Play, replay, profile or benchmark the game.')
+    parser.add_argument('variant', nargs='?', choices=GAME_VARIANTS + LEGACY_VARIANTS, default='fsm')
+    parser.add_argument('--seed', type=int)
+    add_config_arguments(parser)
+    parser.add_argument('--renderer', choices=RENDERERS, help='defaults to sdl')
+    parser.add_argument('--bot', choices=sorted(POLICIES), help='policy that plays headless games')
+    parser.add_argument('--turns', type=int, help='moves a headless bot makes before giving up')
+    parser.add_argument('--replay', metavar='LOG',
+                        help='replay an input log headlessly, as configured when it was recorded, and check it')
+    parser.add_argument('--load', metavar='SAVE',
+                        help='resume a saved game (S saves while playing), or the latest in a directory')
+    parser.add_argument('--autosave-every', type=int, metavar='TURNS', help='autosave in the background')
+    parser.add_argument('--autosave-dir', help='where autosaves go (default autosaves)')
+    parser.add_argument('--autosave-keep', type=int, metavar='N', help='autosaves kept (default 3)')
+    parser.add_argument('--journal', metavar='DIR', help="append every turn's changes to a journal here")
+    parser.add_argument('--recover', metavar='DIR', help='resume the game journaled in DIR')
+    parser.add_argument('--level-cache', type=int, metavar='N',
+                        help='levels kept in memory; older ones are spilled to disk (default 3)')
+    parser.add_argument('--history', type=int, metavar='TURNS', help='keep the last TURNS turns for U to undo')
+    parser.add_argument('--profile', metavar='PSTATS', help='profile the run and write pstats here')
+    parser.add_argument('--profile-turns', type=int, metavar='N',
+                        help='profile the first N turns (P in game profiles the next N)')
+    parser.add_argument('--profile-dir', help='where turn profiles go (default profiles)')
+    parser.add_argument('--profiler', choices=MODES, help='cprofile, sampling or both (default)')
+    parser.add_argument('--tick-rate', type=float, metavar='TICKS',
+                        help='fsm only: turns per second that pass while you wait')
+    parser.add_argument('--bench', action='store_true', help='benchmark the variant instead of playing')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    if args.variant in LEGACY_VARIANTS:
+        game_options = vars(args).copy()
+        for name in ('variant', 'profile', 'bench'):
+            del game_options[name]
+        if any(value is not None for value in game_options.values()):
+            parser.error(f'{args.variant} only supports --profile and --bench')
+    else:
+        config_from_args(args, parser)  # check it before anything starts
+    if args.replay and (args.renderer not in (None, 'headless') or args.bench):
+        parser.error('--replay always runs headless')
+    if (args.load or args.recover) and (args.renderer == 'headless' or args.replay or args.bench):
+        parser.error('--load and --recover are for playing in an SDL window or terminal')
+    if args.load and args.recover:
+        parser.error('--load and --recover are alternatives')
+    if (args.metrics_jsonl or args.metrics_prom) and (args.replay or args.bench):
+        parser.error('metrics are only exported while playing')
+    if args.tick_rate is not None:
+        if args.tick_rate <= 0:
+            parser.error('--tick-rate must be positive')
+        if args.variant != 'fsm' or args.renderer == 'headless' or args.replay or args.bench:
+            parser.error('--tick-rate is for playing fsm in an SDL window or terminal')
+    if (args.bot or args.turns) and args.renderer != 'headless':
+        parser.error('--bot and --turns need --renderer headless')
+    return args
+
+
+def play(
+        variant: str,
+        renderer: str,
+        new_game: Callable[..., Game],
+        metrics: Optional[MetricsExporter] = None,
+        tick_rate: Optional[float] = None
+) -> None:
+    """Play interactively; new_game(root_console, draw_console, backend=) sets up the game."""
+    module = importlib.import_module(variant)
+    # Only fsm has a fixed timestep mode.
+    run_options = {'tick_rate': tick_rate} if tick_rate is not None else {}
+    state_handlers = getattr(module, 'ASYNC_STATE_HANDLERS', None) or module.STATE_HANDLERS
+    console_width, console_height = module.CONSOLE_WIDTH, module.CONSOLE_HEIGHT
+    if renderer == 'ansi':
+        from ansi import AnsiBackend
+        root_console = tcod.console.Console(console_width, console_height, order='F')
+        draw_console = tcod.console.Console(console_width, console_height, order='F')
+        with AnsiBackend() as backend:
+            game = new_game(root_console, draw_console, backend=backend)
+            module.run_fsm(state_handlers, module.State.MAP, game, metrics, **run_options)
+        return
+    with module.open_window() as root_console:
+        draw_console = tcod.console.Console(console_width, console_height, order='F')
+        game = new_game(root_console, draw_console)
+        module.run_fsm(state_handlers, module.State.MAP, game, metrics, **run_options)
+
+
+def play_headless(
+        policy_name: str,
+        seed,
+        max_steps: int,
+        config: GameConfig,
+        profiler: Profiler,
+        metrics: Optional[MetricsExporter] = None
+) -> None:
+    result = play_game(policy_name, seed, max_steps, config, profiler, metrics)
+    outcome = 'won' if result['won'] else 'did not win'
+    print(f'{policy_name} bot {outcome} in {result["turns"]} turns '
+          f'({result["seconds"]:.3f}s, seed {result["seed"]})')
+    for path in result['profiles']:
+        print(f'wrote {path}')
+
+
+def bench(variant: str, seed, config: GameConfig) -> None:
+    report = run_benchmarks([variant], seed=seed if seed is not None else 1, config=config)
+    print('\n'.join(format_results(report)))
+
+
+def run(args: argparse.Namespace) -> bool:
+    """Do what the arguments ask. Returns False if a replay didn't match."""
+    if args.variant in LEGACY_VARIANTS:
+        if args.bench:
+            bench(args.variant, None, None)
+        else:
+            importlib.import_module(args.variant).main()
+        return True
+    config = config_from_args(args)
+    if args.bench:
+        bench(args.variant, args.seed, config)
+        return True
+    if args.replay:
+        return replay.play(args.replay, config)
+    profiler = Profiler(
+        directory=args.profile_dir or 'profiles',
+        turns=args.profile_turns or 100,
+        mode=args.profiler or 'both'
+    )
+    if args.profile_turns:
+        profiler.start(0)
+    metrics = metrics_from_args(args)
+    if args.renderer == 'headless':
+        try:
+            play_headless(args.bot or 'explorer', args.seed, args.turns or 2000, config, profiler, metrics)
+        finally:
+            if metrics is not None:
+                metrics.close()
+        return True
+    # Writers and caches to close when the session ends.
+    persistence = {'dungeon': Dungeon(args.level_cache or 3)}
+    if args.autosave_every:
+        persistence['autosaver'] = Autosaver(
+            args.autosave_dir or 'autosaves',
+            args.autosave_every,
+            args.autosave_keep or 3
+        )
+    if args.journal or args.recover:
+        # A recovered game goes on journaling where it left off.
+        persistence['journal'] = Journal(args.journal or args.recover)
+    history = History(args.history) if args.history else None
+    if args.recover:
+        new_game = partial(recover_game, args.recover, profiler=profiler, history=history, **persistence)
+    elif args.load:
+        path = args.load
+        if os.path.isdir(path):
+            path = latest_autosave(path)
+            if path is None:
+                raise SystemExit(f'No autosaves in {args.load}')
+        new_game = partial(load_game, path, profiler=profiler, history=history, **persistence)
+    else:
+        new_game = partial(
+            build_game,
+            seed=args.seed,
+            config=config,
+            profiler=profiler,
+            history=history,
+            **persistence
+        )
+    try:
+        play(args.variant, args.renderer or 'sdl', new_game, metrics, args.tick_rate)
+    finally:
+        # The dungeon last, as the others' last saves may read levels back from it.
+        for writer in reversed(list(persistence.values())):
+            writer.close()
+        if metrics is not None:
+            metrics.close()
+    return True
+
+
+def profiled(fn: Callable[[], bool], path: str) -> bool:
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(fn)
+    finally:
+        profile.dump_stats(path)
+        print(f'wrote {path}')
+
+
+def main():
+    args = parse_args()
+    if args.profile:
+        ok = profiled(lambda: run(args), args.profile)
+    else:
+        ok = run(args)
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
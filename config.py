@@ -0,0 +1,130 @@
+"""
+Tunable game parameters, from the command line or a JSON config file.
+
+The defaults reproduce the classic game. Stress configurations can go up to
+MAX_MAP_SIZE tiles on a side and MAX_MOBS mobs.
+"""
+import argparse
+from dataclasses import asdict, dataclass, fields
+import json
+from typing import Optional
+
+MAX_MAP_SIZE = 4000
+MAX_MOBS = 100_000
+# Steps of the random walk on the classic map. Bigger maps get more, see
+# GameConfig.walk_steps.
+CLASSIC_WALK_LENGTH = 10000
+
+
+@dataclass
+class GameConfig:
+    map_width: int = 80
+    map_height: int = 40
+    mobs: int = 25
+    # Mobs per floor tile. Overrides mobs when set.
+    spawn_density: Optional[float] = None
+    player_hp: int = 10
+    mob_hp: int = 5
+    fov_radius: int = 10
+    # Steps of the random walk that carves the cave. None scales them with
+    # the map, see walk_steps.
+    walk_length: Optional[int] = None
+    # Only mobs within this many tiles of the player act. None means all do.
+    ai_radius: Optional[int] = None
+    levels: int = 1  # the exit of every level but the last leads to the next
+    # Mobs that see the player within this many tiles close in on them. None
+    # means mobs just wander.
+    mob_sight: Optional[int] = None
+    doors: int = 0  # closed doors in the narrow passages of each level
+
+    def __post_init__(self) -> None:
+        if not 3 <= self.map_width <= MAX_MAP_SIZE or not 3 <= self.map_height <= MAX_MAP_SIZE:
+            raise ValueError(f'Map size must be between 3x3 and {MAX_MAP_SIZE}x{MAX_MAP_SIZE}')
+        if not 0 <= self.mobs <= MAX_MOBS:
+            raise ValueError(f'Mob count must be between 0 and {MAX_MOBS}')
+        if self.spawn_density is not None and not 0 <= self.spawn_density <= 1:
+            raise ValueError('Spawn density must be between 0 and 1')
+        if self.player_hp < 1 or self.mob_hp < 1:
+            raise ValueError('Hit points must be positive')
+        if self.fov_radius < 1:
+            raise ValueError('FOV radius must be positive')
+        if self.walk_length is not None and self.walk_length < 0:
+            raise ValueError('Walk length must not be negative')
+        # The walk carves at most one tile per step, and only inside the
+        # border, so some configurations can't fit their mobs on any seed.
+        room = min(self.walk_steps + 1, (self.map_width - 2) * (self.map_height - 2)) - 2
+        if self.spawn_density is None and self.mobs > room:
+            raise ValueError(
+                f'{self.mobs} mobs can never fit: a {self.map_width}x{self.map_height} map carved in '
+                f'{self.walk_steps} steps has room for at most {max(room, 0)}'
+            )
+        if self.levels < 1:
+            raise ValueError('There must be at least one level')
+        if self.mob_sight is not None and self.mob_sight < 1:
+            raise ValueError('Mob sight must be positive')
+        if self.doors < 0:
+            raise ValueError('Door count must not be negative')
+
+    @property
+    def walk_steps(self) -> int:
+        """walk_length, or half a step per tile of the map (but no fewer than the classic map's)."""
+        if self.walk_length is not None:
+            return self.walk_length
+        return max(CLASSIC_WALK_LENGTH, self.map_width * self.map_height // 2)
+
+    def mob_count(self, floor_tiles: int) -> int:
+        if self.spawn_density is None:
+            return self.mobs
+        return min(MAX_MOBS, int(self.spawn_density * floor_tiles))
+
+    @classmethod
+    def from_file(cls, path: str) -> 'GameConfig':
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def parse_size(value: str):
+    try:
+        width, height = (int(n) for n in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Expected WIDTHxHEIGHT, got {value!r}') from None
+    return width, height
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group('game configuration')
+    group.add_argument('--config', help='JSON file of GameConfig fields; flags override it')
+    group.add_argument('--map-size', type=parse_size, metavar='WxH')
+    group.add_argument('--mobs', type=int)
+    group.add_argument('--spawn-density', type=float, metavar='MOBS_PER_TILE')
+    group.add_argument('--player-hp', type=int)
+    group.add_argument('--mob-hp', type=int)
+    group.add_argument('--fov-radius', type=int)
+    group.add_argument('--walk-length', type=int)
+    group.add_argument('--ai-radius', type=int)
+    group.add_argument('--levels', type=int)
+    group.add_argument('--mob-sight', type=int)
+    group.add_argument('--doors', type=int)
+
+
+def config_from_args(
+        args: argparse.Namespace,
+        parser: Optional[argparse.ArgumentParser] = None
+) -> GameConfig:
+    """The configuration the flags ask for. With a parser, invalid ones are reported through it."""
+    values = GameConfig.from_file(args.config).to_dict() if args.config else {}
+    if args.map_size is not None:
+        values['map_width'], values['map_height'] = args.map_size
+    for field in fields(GameConfig):
+        value = getattr(args, field.name, None)
+        if value is not None:
+            values[field.name] = value
+    try:
+        return GameConfig(**values)
+    except ValueError as error:
+        if parser is None:
+            raise
+        parser.error(str(error))
@@ -0,0 +1,165 @@
+"""
+A dungeon of several levels, of which only a few are kept in memory.
+
+The level being played and the ones most recently left stay in memory, so
+going back and forth between them is just swapping references. Older levels
+are evicted to compressed files and read back when the player returns.
+Meanwhile the levels next to the current one are generated, or read back,
+in the background, so taking the stairs rarely has to wait for either.
+
+Levels are built by the game (see fsm.build_level()), from a seed and the
+level's number or from the arrays spilled to disk, so this module only
+decides what lives where.
+"""
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+import os
+import tempfile
+from typing import Any, Callable, Dict, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from bitmemory import BitMemory
+import savegame
+
+# Builds level number n, from the arrays spilled to disk if given.
+LevelBuilder = Callable[[int, Optional[Dict[str, np.ndarray]]], 'Level']
+
+
+@dataclass
+class Level:
+    tile_codes: np.ndarray
+    occupied_coords: Set[Tuple[int, int]]  # not counting the player
+    mobs: Dict[Tuple[int, int], Any]
+    fov_map: Any
+    memory: BitMemory
+    exit_x: int
+    exit_y: int
+    # The way back to the previous level, None on the first one.
+    entrance_x: Optional[int] = None
+    entrance_y: Optional[int] = None
+
+
+class Dungeon:
+
+    def __init__(self, keep: int = 3, directory: Optional[str] = None) -> None:
+        if keep < 1:
+            raise ValueError('At least one level must be kept in memory')
+        self.keep = keep  # levels kept in memory, counting the current one
+        if directory is None:
+            # Removed when the dungeon is closed or garbage collected.
+            self._tmp = tempfile.TemporaryDirectory(prefix='pmrl-levels-')
+            directory = self._tmp.name
+        else:
+            self._tmp = None
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.build: Optional[LevelBuilder] = None
+        self.count = 1  # levels in the dungeon
+        self.levels: 'OrderedDict[int, Level]' = OrderedDict()  # least recently used first
+        self.spilled: Set[int] = set()
+        self._pending: Dict[int, Future] = {}  # levels being generated or read back
+        # One worker, so a level is always written before it is read back.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dungeon')
+
+    def reset(
+            self,
+            build: LevelBuilder,
+            count: int,
+            number: int = 0,
+            levels: Optional[Dict[int, Dict[str, np.ndarray]]] = None
+    ) -> None:
+        """
+        Start a new dungeon of count levels, with the player on level number.
+        Levels already visited, e.g. in a save, can be given by number as the
+        arrays savegame.pack_level() returns.
+        """
+        for future in self._pending.values():
+            future.cancel()
+        self._executor.submit(self._forget, set(self.spilled)).result()
+        self.build = build
+        self.count = count
+        self.levels.clear()
+        self.spilled.clear()
+        self._pending.clear()
+        for visited, arrays in (levels or {}).items():
+            # Kept as if spilled, to be read back when the player returns.
+            self.spilled.add(visited)
+            self._executor.submit(self._write, visited, arrays)
+        self.prefetch(number - 1)
+        self.prefetch(number + 1)
+
+    def swap(self, number: int, level: Level, to: int) -> Level:
+        """Keep level number, which the player is leaving, and return level to."""
+        future = self._pending.pop(to, None)
+        if to in self.levels:
+            arriving = self.levels.pop(to)
+        elif future is not None:
+            arriving = future.result()
+        else:
+            arriving = self._executor.submit(self._load, to).result()
+        self._keep(number, level)
+        self._keep(to, arriving)
+        self.prefetch(to - 1)
+        self.prefetch(to + 1)
+        return arriving
+
+    def prefetch(self, number: int) -> None:
+        """Get level number ready in the background, unless it already is."""
+        if not 0 <= number < self.count or number in self.levels or number in self._pending:
+            return
+        self._pending[number] = self._executor.submit(self._load, number)
+
+    def visited(self, current: int) -> Dict[int, Union[Level, Future]]:
+        """
+        The levels other than current that the player has been on: those in
+        memory, and futures of the arrays of those spilled to disk.
+        """
+        levels: Dict[int, Union[Level, Future]] = {
+            number: self._executor.submit(self._read, number)
+            for number in self.spilled
+            if number != current and number not in self.levels
+        }
+        levels.update((number, level) for number, level in self.levels.items() if number != current)
+        return levels
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        if self._tmp is not None:
+            self._tmp.cleanup()
+
+    def path(self, number: int) -> str:
+        return os.path.join(self.directory, f'level-{number}.npz')
+
+    def _keep(self, number: int, level: Level) -> None:
+        self.levels[number] = level
+        self.levels.move_to_end(number)
+        while len(self.levels) > self.keep:
+            evicted, level = self.levels.popitem(last=False)
+            self.spilled.add(evicted)
+            self._executor.submit(self._spill, evicted, level)
+
+    def _spill(self, number: int, level: Level) -> None:
+        self._write(number, savegame.pack_level(level))
+
+    def _write(self, number: int, arrays: Dict[str, np.ndarray]) -> None:
+        np.savez_compressed(self.path(number), **arrays)
+
+    def _read(self, number: int) -> Dict[str, np.ndarray]:
+        with np.load(self.path(number)) as npz:
+            return {name: npz[name] for name in npz.files}
+
+    def _load(self, number: int) -> Level:
+        if number not in self.spilled:
+            return self.build(number, None)
+        arrays = self._read(number)
+        arrays['memory'] = savegame.unpack_memory(arrays['memory'], arrays['tile_codes'].shape)
+        return self.build(number, arrays)
+
+    def _forget(self, numbers: Set[int]) -> None:
+        for number in numbers:
+            try:
+                os.remove(self.path(number))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,50 @@
+"""
+What the player can see right now, kept as a small window of the map.
+
+Nothing beyond the FOV radius can be seen, so the FOV is computed over the
+box of that radius around the player rather than over the whole map, and
+kept as that box plus where it sits on the map. Remembering what was seen,
+drawing it and checking whether a mob is in view then cost the same on a
+huge level as on a small one.
+"""
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+import tcod.map
+
+
+@dataclass
+class FieldOfView:
+    x: int  # the window's top left tile on the map
+    y: int
+    visible: np.ndarray  # bool window indexed [y, x] from x, y
+    pov: Tuple[int, int]  # where it was seen from
+    version: int = 0  # of the tiles, see terrain.Changes
+
+    def __contains__(self, coords) -> bool:
+        """Whether map tile (x, y) is in view."""
+        x, y = coords[0] - self.x, coords[1] - self.y
+        height, width = self.visible.shape
+        return 0 <= x < width and 0 <= y < height and bool(self.visible[y, x])
+
+    def window(self, x: int, y: int, width: int, height: int) -> np.ndarray:
+        """What's in view within a box of the map, as a boolean array indexed [y, x]."""
+        out = np.zeros((height, width), dtype=bool)
+        fov_height, fov_width = self.visible.shape
+        x0, y0 = max(x, self.x), max(y, self.y)
+        x1, y1 = min(x + width, self.x + fov_width), min(y + height, self.y + fov_height)
+        if x0 < x1 and y0 < y1:
+            out[y0 - y:y1 - y, x0 - x:x1 - x] = self.visible[y0 - self.y:y1 - self.y, x0 - self.x:x1 - self.x]
+        return out
+
+
+def field_of_view(transparent: np.ndarray, x: int, y: int, radius: int, version: int = 0) -> FieldOfView:
+    """What can be seen from x, y, given a transparency array indexed [y, x]."""
+    height, width = transparent.shape
+    x0, y0 = max(x - radius, 0), max(y - radius, 0)
+    x1, y1 = min(x + radius + 1, width), min(y + radius + 1, height)
+    # The same as computing it on the whole map, as tiles past the radius
+    # are never lit.
+    visible = tcod.map.compute_fov(transparent[y0:y1, x0:x1], (y - y0, x - x0), radius)
+    return FieldOfView(x0, y0, visible, (x, y), version)
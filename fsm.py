@@ -1,15 +1,52 @@
+from collections import Counter, defaultdict
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Callable, Dict, List, Optional, Set, Tuple
-import random
+from functools import partial
+import hashlib
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Type
+import warnings
 
 import numpy as np
 import tcod
 import tcod.event
 
+import autoexplore
+from autosave import Autosaver
+from bitmemory import BitMemory
+from config import GameConfig
+from dungeon import Dungeon, Level
+from fov import FieldOfView, field_of_view
+from history import History
+from journal import Journal, apply_records, latest_base
+from metrics import MetricsExporter
+from perception import Perception
+from profiler import Profiler
+from recording import Recorder
+from rng import RngService
+import savegame
+from terrain import DOOR, FLOOR, OPEN_DOOR, WALL, Changes, derive, set_tile
+from timing import Timings, draw_timings, timed
+import travel
+
 CONSOLE_WIDTH = 80
 CONSOLE_HEIGHT = 50
 
+MOB_MOVES = [
+    (0, 0),  # sit still
+    (-1, 0),  # left
+    (1, 0),  # right
+    (0, -1),  # up
+    (0, 1),  # down
+]
+
+# What acting on a tile turns it into, and what the player is told.
+TILE_ACTIONS = {
+    'open': (OPEN_DOOR, 'You open the door.'),
+    'close': (DOOR, 'You close the door.'),
+    'dig': (FLOOR, 'You dig through the wall.'),
+}
+
 
 @dataclass
 class Mob:
@@ -26,22 +63,75 @@ class Game:
     player_y: int
     player_hp: int
     # world state
-    map_tiles: List[List[str]]
+    tile_codes: np.ndarray  # tile characters as uint8 codes, indexed [y, x]
     occupied_coords: Set[Tuple[int, int]]
     mobs: Dict[Tuple[int, int], Mob]
-    fov_map: tcod.map.Map
-    memory: np.ndarray
+    fov_map: tcod.map.Map  # walkable and transparent tiles, see terrain.py
+    fov: FieldOfView  # tiles the player can see
+    memory: BitMemory  # tiles the player has seen
     exit_x: int
     exit_y: int
     # meta state
     map_height: int
     map_width: int
+    view_height: int  # how much of the map fits on screen
+    view_width: int
     dialog_height: int
     dialog_width: int
     stats_height: int
     stats_width: int
     messages: List[str] = field(default_factory=list)
     won: Optional[bool] = None  # True if won, False if lost, None if in progress
+    turns: int = 0  # turns taken, i.e. moves, attacks, etc. by the player
+    level: int = 0  # exits taken, i.e. which level of the dungeon this is
+    # The way back to the previous level, None on the first one.
+    entrance_x: Optional[int] = None
+    entrance_y: Optional[int] = None
+    # Where frames go and input comes from. None means the SDL root console.
+    backend: Optional['Backend'] = None
+    timings: Timings = field(default_factory=Timings)
+    rng: RngService = field(default_factory=RngService)
+    recorder: Optional[Recorder] = None  # logs dispatched input for replays
+    profiler: Profiler = field(default_factory=Profiler)
+    autosaver: Optional[Autosaver] = None
+    journal: Optional[Journal] = None  # appends every turn's changes
+    history: Optional[History] = None  # recent turns, for rewinding
+    dungeon: Optional[Dungeon] = None  # the other levels, if there are any
+    perception: Perception = field(default_factory=Perception)  # which mobs see the player
+    tile_changes: Changes = field(default_factory=Changes)  # for what's derived from tile_codes
+    config: GameConfig = field(default_factory=GameConfig)
+
+
+class Backend:
+    """
+    Alternative to the SDL window for presenting frames and reading input.
+    Frames are the same draw console buffers that blit_and_flush() blits.
+    """
+
+    def present(self, console: tcod.console.Console) -> None:
+        raise NotImplementedError()
+
+    def wait(self, timeout: Optional[float] = None) -> Iterable[tcod.event.Event]:
+        """Block until input arrives or timeout seconds pass."""
+        raise NotImplementedError()
+
+    def fileno(self) -> Optional[int]:
+        """A file descriptor that becomes readable when input arrives, if any."""
+        return None
+
+
+class HeadlessBackend(Backend):
+    """Draws nowhere and plays back scripted input, e.g. for bots and replays."""
+
+    def __init__(self, batches: Iterable[List[tcod.event.Event]] = ()) -> None:
+        self.batches = iter(batches)
+
+    def present(self, console: tcod.console.Console) -> None:
+        pass
+
+    def wait(self, timeout: Optional[float] = None) -> List[tcod.event.Event]:
+        # Quit once the script runs out.
+        return next(self.batches, [tcod.event.Quit()])
 
 
 class State(Enum):
@@ -51,31 +141,86 @@ class State(Enum):
 
 class StateHandler(tcod.event.EventDispatch):
 
+    # Seconds an input batch may take before key repeats in it are dropped.
+    # None keeps every repeat.
+    input_latency_budget: Optional[float] = 0.1
+
     def __init__(self, next_state: Optional[State], game: Game) -> None:
         """Constructor"""
         self.next_state = next_state
         self.game = game
+        # When the input being handled arrived, for measuring input latency.
+        self.input_at = 0.0
 
     def handle(self) -> Tuple[Optional[State], Game]:
         """
         Dispatch pending input events to handler methods, and then return the
         next state and a game instance to use in that state.
         """
-        for event in tcod.event.wait():
-            self.dispatch(event)
+        events = wait_for_events(self.game)
+        self.input_at = perf_counter()
+        self.dispatch_batch(events, self.input_at)
         return self.next_state, self.game
 
+    def dispatch_batch(
+            self,
+            events: Iterable[tcod.event.Event],
+            arrived_at: float
+    ) -> None:
+        """
+        Run every queued event back to back, with no rendering in between.
+        Key repeats are dropped once handling the batch has taken longer than
+        the latency budget, so holding a key down never queues up turns.
+        Events after a state change are dropped too, since they were meant
+        for this state.
+        """
+        state = self.next_state
+        budget = self.input_latency_budget
+        for event in events:
+            if self.next_state != state:
+                break
+            if (
+                budget is not None
+                and getattr(event, 'repeat', False)
+                and perf_counter() - arrived_at > budget
+            ):
+                continue
+            if self.game.recorder is not None:
+                self.game.recorder.record(event)
+            with self.game.timings.phase('dispatch'):
+                self.dispatch(event)
+
+    def update(self, dt: float) -> bool:
+        """
+        Override this to advance the simulation by one fixed tick of dt seconds
+        when running on a fixed timestep. Return True if the screen changed.
+        """
+        return False
+
     def draw(self) -> None:
         """Override this to draw the screen for this state."""
         pass
 
     def on_enter_state(self) -> None:
-        self.draw()
-        blit_and_flush(self.game.draw_console, self.game.root_console)
+        self.render()
 
     def on_reenter_state(self) -> None:
+        self.render()
+
+    def on_exit_state(self) -> None:
+        pass
+
+    def render(self) -> None:
         self.draw()
-        blit_and_flush(self.game.draw_console, self.game.root_console)
+        if self.game.timings.overlay:
+            draw_timings(self.game.draw_console, self.game.timings)
+        present(self.game)
+
+    def toggle_fullscreen(self) -> None:
+        # Only the SDL window has a notion of fullscreen.
+        if self.game.backend is None:
+            fullscreen = not tcod.console_is_fullscreen()
+            tcod.console_set_fullscreen(fullscreen)
 
 
 def blit_and_flush(
@@ -90,18 +235,111 @@ def blit_and_flush(
     tcod.console_flush()
 
 
+def present(game: Game) -> None:
+    with game.timings.phase('flush'):
+        if game.backend is None:
+            blit_and_flush(game.draw_console, game.root_console)
+        else:
+            game.backend.present(game.draw_console)
+
+
+def wait_for_events(
+        game: Game,
+        timeout: Optional[float] = None
+) -> Iterable[tcod.event.Event]:
+    if game.profiler.active:
+        with game.profiler.paused():
+            return _wait_for_events(game, timeout)
+    return _wait_for_events(game, timeout)
+
+
+def _wait_for_events(
+        game: Game,
+        timeout: Optional[float]
+) -> Iterable[tcod.event.Event]:
+    if game.backend is None:
+        return tcod.event.wait(timeout)
+    return game.backend.wait(timeout)
+
+
+def is_headless(game: Game) -> bool:
+    """Whether input is scripted, as for bots and replays, rather than a player's."""
+    return isinstance(game.backend, HeadlessBackend)
+
+
+def report_profile(game: Game, paths: List[str]) -> None:
+    if paths:
+        game.messages.append(f'Wrote {len(paths)} profile(s) to {game.profiler.directory}/')
+
+
+def rewind(game: Game, turns: int = 1) -> int:
+    """Undo the last turns, if the game keeps a history. Returns how many were undone."""
+    if game.history is None:
+        return 0
+    undone = game.history.rewind(game, turns)
+    if undone:
+        compute_fov(game)
+        if game.journal is not None:
+            game.journal.compact(game)  # the journal can't take turns back either
+    return undone
+
+
+def take_stairs(game: Game, to: int) -> None:
+    """Leave for level to, arriving at the stairs that lead back."""
+    player_coords = game.player_x, game.player_y
+    if player_coords != (game.exit_x, game.exit_y):
+        game.occupied_coords.discard(player_coords)
+    leaving = Level(
+        tile_codes=game.tile_codes,
+        occupied_coords=game.occupied_coords,
+        mobs=game.mobs,
+        fov_map=game.fov_map,
+        memory=game.memory,
+        exit_x=game.exit_x,
+        exit_y=game.exit_y,
+        entrance_x=game.entrance_x,
+        entrance_y=game.entrance_y
+    )
+    level = game.dungeon.swap(game.level, leaving, to)
+    game.tile_codes = level.tile_codes
+    game.occupied_coords = level.occupied_coords
+    game.mobs = level.mobs
+    game.fov_map = level.fov_map
+    game.memory = level.memory
+    game.exit_x, game.exit_y = level.exit_x, level.exit_y
+    game.entrance_x, game.entrance_y = level.entrance_x, level.entrance_y
+    game.tile_changes.mark_all()  # a whole new map
+    if to > game.level:
+        x, y = level.entrance_x, level.entrance_y
+        game.messages.append(f'You climb to level {to + 1}.')
+    else:
+        x, y = level.exit_x, level.exit_y
+        game.messages.append(f'You go back down to level {to + 1}.')
+    game.level = to
+    # Mobs can wander onto the stairs, in which case arrive next to them.
+    for dx, dy in MOB_MOVES:
+        if (x + dx, y + dy) not in game.mobs and is_walkable(x + dx, y + dy, game.fov_map.walkable):
+            x, y = x + dx, y + dy
+            break
+    game.player_x, game.player_y = x, y
+    game.occupied_coords.add((x, y))
+    fov = compute_fov(game)
+    game.memory.or_in(fov.x, fov.y, fov.visible)
+    # Neither can follow the player to another level.
+    if game.history is not None:
+        game.history.clear()
+    if game.journal is not None:
+        game.journal.compact(game)
+
+
 def draw_endgame(game: Game):
         result_msg = 'You win!' if game.won else 'You lose.'
         game.draw_console.clear()
         game.draw_console.print(1, 1, result_msg)
         game.draw_console.print(1, 3, 'Press R to play again')
         game.draw_console.print(1, 5, 'Press Q to quit')
-        game.draw_console.blit(
-            game.root_console,
-            width=game.draw_console.width,
-            height=game.draw_console.height
-        )
-        tcod.console_flush()
+        if game.history is not None and len(game.history):
+            game.draw_console.print(1, 7, 'Press U to undo your last move')
 
 
 def draw_map(game: Game) -> None:
@@ -109,7 +347,7 @@ def draw_map(game: Game) -> None:
     # Display messages in a bordered pane.
     game.draw_console.draw_frame(
         0,
-        game.map_height,
+        game.view_height,
         game.dialog_width,
         game.dialog_height,
         title='Messages'
@@ -117,61 +355,125 @@ def draw_map(game: Game) -> None:
     for i, msg in enumerate(game.messages[-6:]):
         game.draw_console.print(
             2,
-            game.map_height + 2 + i,
+            game.view_height + 2 + i,
             msg
         )
     # Display stats in a bordered pane.
     game.draw_console.draw_frame(
         game.dialog_width,
-        game.map_height,
+        game.view_height,
         game.stats_width,
         game.stats_height,
         title='Stats'
     )
     game.draw_console.print(
         game.dialog_width + 2,
-        game.map_height + 2,
+        game.view_height + 2,
         f'Health: {game.player_hp}',
         fg=tcod.red
     )
-    # Draw visible (white) and previously visible (gray) walls and floors.
-    for y, row in enumerate(game.map_tiles):
-        for x, tile in enumerate(row):
-            if game.fov_map.fov[y][x]:
-                game.draw_console.draw_rect(x, y, 1, 1, ord(tile), fg=tcod.white)
-            elif game.memory[y][x]:
-                game.draw_console.draw_rect(x, y, 1, 1, ord(tile), fg=tcod.dark_gray)
-    # Draw the exit if it is visible or was previously visible.
-    if game.fov_map.fov[game.exit_y][game.exit_x] or game.memory[game.exit_y][game.exit_x]:
-        game.draw_console.draw_rect(
-            game.exit_x,
-            game.exit_y,
-            1,
-            1,
-            ord('<'),
-            fg=tcod.green
+    if game.config.levels > 1:
+        game.draw_console.print(
+            game.dialog_width + 2,
+            game.view_height + 3,
+            f'Level: {game.level + 1}/{game.config.levels}'
         )
+    # Draw visible (white) and previously visible (gray) walls and floors,
+    # for the part of the map that is in view. Consoles are indexed [x, y],
+    # hence the transposes.
+    camera_x, camera_y = camera(game)
+    view = np.s_[camera_y:camera_y + game.view_height, camera_x:camera_x + game.view_width]
+    visible = game.fov.window(camera_x, camera_y, game.view_width, game.view_height).T
+    remembered = game.memory[view].T & ~visible
+    seen = visible | remembered
+    ch = game.draw_console.ch[:game.view_width, :game.view_height]
+    fg = game.draw_console.fg[:game.view_width, :game.view_height]
+    ch[seen] = game.tile_codes[view].T[seen]
+    fg[visible] = tcod.white
+    fg[remembered] = tcod.dark_gray
+    # Draw the exit, and the way back if any, if visible or previously visible.
+    stairs = [(game.exit_x, game.exit_y, '<')]
+    if game.entrance_x is not None:
+        stairs.append((game.entrance_x, game.entrance_y, '>'))
+    for x, y, glyph in stairs:
+        x, y = x - camera_x, y - camera_y
+        if 0 <= x < game.view_width and 0 <= y < game.view_height and seen[x, y]:
+            game.draw_console.draw_rect(x, y, 1, 1, ord(glyph), fg=tcod.green)
     # Draw the mobs after the exit, so they can hide it by standing on it. ;)
-    for mob_x, mob_y in game.mobs.keys():
-        if game.fov_map.fov[mob_y][mob_x]:
-            game.draw_console.draw_rect(mob_x, mob_y, 1, 1, ord('O'), fg=tcod.red)
+    for mob_x, mob_y in travel.visible_mobs(game):
+        game.draw_console.draw_rect(mob_x - camera_x, mob_y - camera_y, 1, 1, ord('O'), fg=tcod.red)
     # Always draw the player.
     game.draw_console.draw_rect(
-        game.player_x,
-        game.player_y,
+        game.player_x - camera_x,
+        game.player_y - camera_y,
         1,
         1,
         ord('@'),
         fg=tcod.yellow
     )
 
+
+def camera(game: Game) -> Tuple[int, int]:
+    """The map tile at the top left of the view, which follows the player."""
+    x = game.player_x - game.view_width // 2
+    y = game.player_y - game.view_height // 2
+    return (
+        min(max(x, 0), game.map_width - game.view_width),
+        min(max(y, 0), game.map_height - game.view_height),
+    )
+
 class MapStateHandler(StateHandler):
 
-    def on_reenter_state(self):
-        self.game.fov_map.compute_fov(self.game.player_x, self.game.player_y, 10)
-        self.game.memory |= self.game.fov_map.fov
-        super().on_reenter_state()
+    # Seconds between frames drawn while running or traveling. None draws
+    # only where the player stops.
+    travel_animation_interval: Optional[float] = None
+
+    def __init__(self, next_state: Optional[State], game: Game) -> None:
+        super().__init__(next_state, game)
+        self.explorer: Optional[autoexplore.Explorer] = None
+        self.verb: Optional[str] = None  # 'dig' or 'close', waiting for a direction
+        self.turns_at_tick = game.turns
+
+    def on_enter_state(self):
+        # Coming back from the endgame, the game was restarted or rewound.
+        self.explorer = None
+        self.turns_at_tick = self.game.turns
+        super().on_enter_state()
+
+    def update(self, dt: float) -> bool:
+        # On a fixed timestep the mobs don't wait for the player: a tick in
+        # which the player took no turn is a turn they spent waiting.
+        waited = self.game.turns == self.turns_at_tick
+        if waited:
+            self.wait()
+        self.turns_at_tick = self.game.turns
+        return waited
+
+    @timed('compute_fov')
+    def update_fov(self):
+        fov = compute_fov(self.game)
+        if self.game.journal is not None or self.game.history is not None:
+            self.record_memory(fov)
+        self.game.memory.or_in(fov.x, fov.y, fov.visible)
 
+    def record_memory(self, fov: FieldOfView):
+        x0, y0 = fov.x, fov.y
+        height, width = fov.visible.shape
+        seen = fov.visible & ~self.game.memory.window(x0, y0, width, height)
+        if not seen.any():
+            return
+        if self.game.journal is not None:
+            self.game.journal.memory_seen(x0, y0, seen)
+        if self.game.history is not None:
+            ys, xs = np.nonzero(seen)
+            self.game.history.memory_changing(
+                x0 + int(xs.min()),
+                y0 + int(ys.min()),
+                int(xs.max() - xs.min()) + 1,
+                int(ys.max() - ys.min()) + 1
+            )
+
+    @timed('draw_map')
     def draw(self):
         draw_map(self.game)
 
@@ -179,28 +481,114 @@ class MapStateHandler(StateHandler):
         self.next_state = None
 
     def ev_keydown(self, event):
+        # D and C act in the direction pressed next. Any other key cancels them.
+        verb, self.verb = self.verb, None
         if event.scancode == tcod.event.SCANCODE_F:
-            fullscreen = not tcod.console_is_fullscreen()
-            tcod.console_set_fullscreen(fullscreen)
+            self.toggle_fullscreen()
         elif event.scancode == tcod.event.SCANCODE_Q:
             self.next_state = None  # quit
         elif event.scancode == tcod.event.SCANCODE_W:
             self.game.won = True  # win
             self.next_state = State.ENDGAME
         elif event.scancode == tcod.event.SCANCODE_H:
-            self.maybe_move(-1, 0)  # left
+            self.move_or_run(event, -1, 0, verb)  # left
         elif event.scancode == tcod.event.SCANCODE_J:
-            self.maybe_move(0, 1)  # down
+            self.move_or_run(event, 0, 1, verb)  # down
         elif event.scancode == tcod.event.SCANCODE_K:
-            self.maybe_move(0, -1)  # up
+            self.move_or_run(event, 0, -1, verb)  # up
         elif event.scancode == tcod.event.SCANCODE_L:
-            self.maybe_move(1, 0)  # right
+            self.move_or_run(event, 1, 0, verb)  # right
+        elif event.scancode == tcod.event.SCANCODE_O:
+            self.auto_explore()
+        elif event.scancode == tcod.event.SCANCODE_X:
+            # travel to the exit, if we know where it is
+            travel.travel(self, self.game.exit_x, self.game.exit_y, self.travel_animation_interval)
+        elif event.scancode == tcod.event.SCANCODE_T:
+            self.game.timings.toggle()  # show/hide the timings overlay
+        elif event.scancode == tcod.event.SCANCODE_P:
+            self.toggle_profiler()
+        elif event.scancode == tcod.event.SCANCODE_S:
+            self.save()
+        elif event.scancode == tcod.event.SCANCODE_U:
+            self.rewind()
+        elif event.scancode == tcod.event.SCANCODE_PERIOD and event.mod & tcod.event.KMOD_SHIFT:
+            self.go_back()  # > on the entrance
+        elif event.scancode == tcod.event.SCANCODE_D:
+            self.ask_direction('dig')
+        elif event.scancode == tcod.event.SCANCODE_C:
+            self.ask_direction('close')  # a door
+
+    def ev_mousebuttondown(self, event):
+        # travel to the clicked tile
+        camera_x, camera_y = camera(self.game)
+        x, y = event.tile
+        travel.travel(self, x + camera_x, y + camera_y, self.travel_animation_interval)
+
+    def save(self):
+        # Headless, e.g. replaying, go through the motions without
+        # overwriting the save.
+        if not is_headless(self.game):
+            savegame.save_game(self.game, savegame.SAVE_PATH)
+        self.game.messages.append(f'Saved to {savegame.SAVE_PATH}.')
+
+    def toggle_profiler(self):
+        profiler = self.game.profiler
+        if profiler.active:
+            report_profile(self.game, profiler.stop())
+        else:
+            profiler.start(self.game.turns, dry=is_headless(self.game))
+            self.game.messages.append(f'Profiling the next {profiler.turns} turns.')
+
+    def rewind(self, turns: int = 1):
+        if rewind(self.game, turns):
+            # The explorer only knows how to grow its map with memory, not shrink it.
+            self.explorer = None
+        else:
+            self.game.messages.append('There is nothing to undo.')
+
+    def go_back(self):
+        if (self.game.player_x, self.game.player_y) != (self.game.entrance_x, self.game.entrance_y):
+            self.game.messages.append('There is no way back here.')
+            return
+        self.change_level(self.game.level - 1)
+
+    def change_level(self, to: int):
+        take_stairs(self.game, to)
+        self.explorer = None  # its map was of the level left behind
+
+    def auto_explore(self):
+        # The explorer's distance map is kept between commands and repaired
+        # as memory grows, so it is only rebuilt for a new game.
+        if self.explorer is None or self.explorer.game is not self.game:
+            self.explorer = autoexplore.Explorer(self.game)
+        autoexplore.explore(self, self.explorer, self.travel_animation_interval)
+
+    def ask_direction(self, verb: str):
+        self.verb = verb
+        self.game.messages.append(f'{verb.capitalize()} in which direction?')
+
+    def move_or_run(self, event, dx, dy, verb: Optional[str] = None):
+        # A pending verb acts in that direction. Otherwise holding shift runs
+        # in that direction instead of taking one step.
+        if verb is not None:
+            self.maybe_move(dx, dy, verb)
+        elif event.mod & tcod.event.KMOD_SHIFT:
+            travel.run(self, dx, dy, self.travel_animation_interval)
+        else:
+            self.maybe_move(dx, dy)
 
     def handle_attack(self, coords: Tuple[int, int], mob: Mob):
         # We let the player strike first, then check if the mob is dead prior
         # to counterattack. This gives the player a slight advantage.
+        if self.game.history is not None:
+            self.game.history.mob_changing(coords)
         mob.hp -= 1
         self.game.messages.append('Your hit an orc.')
+        if self.game.journal is not None:
+            if mob.hp <= 0:
+                self.game.journal.mob_died(coords)
+            else:
+                self.game.journal.mob_hp(coords, mob.hp)
         if mob.hp <= 0:
             self.game.mobs.pop(coords)
             self.game.occupied_coords.remove(coords)
@@ -212,6 +600,16 @@ class MapStateHandler(StateHandler):
             self.game.won = False
             self.next_state = State.ENDGAME
 
+    def handle_tile_action(self, coords: Tuple[int, int], action_type: str):
+        code, message = TILE_ACTIONS[action_type]
+        x, y = coords
+        if self.game.history is not None:
+            self.game.history.array_changing('tile_codes', x, y, 1, 1)
+        set_tile(self.game, x, y, code)
+        if self.game.journal is not None:
+            self.game.journal.tile_changed(coords, code)
+        self.game.messages.append(message)
+
     def handle_move(self, dx, dy):
         # When moving left, don't let x go below zero
         # When moving right, don't let x reach the console width
@@ -229,49 +627,106 @@ class MapStateHandler(StateHandler):
         else:
             limit_y_fn = min
             limit_y = self.game.map_height - 1
-        # Move the player and record their new position
-        self.game.occupied_coords.remove((self.game.player_x, self.game.player_y))
+        # Move the player and record their new position. The exit stays
+        # occupied when they step off it.
+        if (self.game.player_x, self.game.player_y) != (self.game.exit_x, self.game.exit_y):
+            self.game.occupied_coords.remove((self.game.player_x, self.game.player_y))
         self.game.player_x = limit_x_fn(limit_x, self.game.player_x + dx)
         self.game.player_y = limit_y_fn(limit_y, self.game.player_y + dy)
         self.game.occupied_coords.add((self.game.player_x, self.game.player_y))
 
-    def maybe_move(self, dx, dy):
+    @timed('maybe_move')
+    def maybe_move(self, dx, dy, verb: Optional[str] = None):
         # A move can imply an action, like attacking a mob, opening a
-        # closed door, opening a chest, etc.
-        coords, action_type, action_target = self.check_move(
-            self.game.player_x,
-            self.game.player_y,
-            dx,
-            dy,
-            allow_attack=True
-        )
+        # closed door, opening a chest, etc. A verb, like digging, acts on
+        # the tile in that direction instead.
+        if verb is None:
+            coords, action_type, action_target = self.check_move(
+                self.game.player_x,
+                self.game.player_y,
+                dx,
+                dy,
+                allow_attack=True
+            )
+        else:
+            coords, action_type, action_target = self.check_verb(dx, dy, verb)
         if not action_type:
             # This indicates that the action is blocked. We skip the entirely
             # if the player tries to make a bogus move rather than penalize
             # them by letting all the mobs move.
-            self.game.messages.append('Your path is blocked.')
+            if verb == 'dig':
+                self.game.messages.append('There is no wall to dig there.')
+            elif verb == 'close':
+                self.game.messages.append('There is no open door to close there.')
+            else:
+                self.game.messages.append('Your path is blocked.')
             return
+        if self.game.history is not None:
+            self.game.history.begin(self.game)
         if action_type == 'attack':
             self.handle_attack(coords, action_target)
         elif action_type == 'move':
             self.handle_move(dx, dy)
+        else:
+            self.handle_tile_action(coords, action_type)
+        self.move_mobs()
+        self.game.turns += 1
+        # Keep the FOV and memory current after every turn, so a batch of
+        # moves rendered once still remembers everything seen along the way.
+        self.update_fov()
+        # Send the player to endgame if they reached the exit of the last
+        # level, or on to the next level if not.
+        player_coords = self.game.player_x, self.game.player_y
+        exit_coords = self.game.exit_x, self.game.exit_y
+        climb = False
+        if action_type == 'move' and player_coords == exit_coords:
+            if self.game.level + 1 < self.game.config.levels:
+                climb = True
+            else:
+                self.game.won = True
+                self.next_state = State.ENDGAME
+        if self.game.journal is not None:
+            self.game.journal.commit(self.game)
+        if self.game.history is not None:
+            self.game.history.commit()
+        if climb:
+            self.change_level(self.game.level + 1)
+
+    def wait(self):
+        """Let the mobs take a turn while the player stands still."""
+        if self.game.history is not None:
+            self.game.history.begin(self.game)
+        self.move_mobs()
+        self.game.turns += 1
+        self.update_fov()
+        if self.game.journal is not None:
+            self.game.journal.commit(self.game)
+        if self.game.history is not None:
+            self.game.history.commit()
+
+    @timed('ai')
+    def move_mobs(self):
         # Now move the mobs. We freeze the keys view using a list so we can
         # change the dict as we go.
-        for mob_coords in list(self.game.mobs.keys()):
-            # Choose a random direction
-            mob_move = random.choice([
-                (0, 0),  # sit still
-                (-1, 0),  # left
-                (1, 0),  # right
-                (0, -1),  # up
-                (0, 1),  # down
-            ])
+        if self.game.config.ai_radius is None:
+            mobs_coords = list(self.game.mobs.keys())
+        else:
+            mobs_coords = travel.mobs_near(self.game, self.game.config.ai_radius)
+        # Choose a random direction for every mob in one draw.
+        mob_moves = self.game.rng.ai.integers(len(MOB_MOVES), size=len(mobs_coords))
+        watchers = self.game.perception.watchers(self.game)
+        player_coords = self.game.player_x, self.game.player_y
+        for mob_coords, mob_move_index in zip(mobs_coords, mob_moves):
+            if mob_coords in watchers:
+                mob_move = step_towards(mob_coords, player_coords)
+            else:
+                mob_move = MOB_MOVES[mob_move_index]
             # If the mob chose to sit still, skip to the next mob.
             if not any(mob_move):
                 continue
             # Mobs only retaliate for now (see handle_attack()) - other than
-            # that they just wander aimlessly. So we ignore moves that would
-            # result in attack.
+            # that they wander aimlessly, or close in on the player if they
+            # can see them. So we ignore moves that would result in attack.
             mob_x, mob_y = mob_coords
             mob_dx, mob_dy = mob_move
             mob_move_coords, mob_action_type, _ = self.check_move(
@@ -281,16 +736,16 @@ class MapStateHandler(StateHandler):
                 mob_dy
             )
             if mob_action_type == 'move':
+                if self.game.history is not None:
+                    self.game.history.mob_changing(mob_coords)
+                    self.game.history.mob_changing(mob_move_coords)
                 mob = self.game.mobs.pop(mob_coords)
-                self.game.occupied_coords.remove(mob_coords)
+                if mob_coords != (self.game.exit_x, self.game.exit_y):
+                    self.game.occupied_coords.remove(mob_coords)
                 self.game.mobs[mob_move_coords] = mob
                 self.game.occupied_coords.add(mob_move_coords)
-        # Send the player to endgame if they reached the exit.
-        player_coords = self.game.player_x, self.game.player_y
-        exit_coords = self.game.exit_x, self.game.exit_y
-        if player_coords == exit_coords:
-            self.game.won = True
-            self.next_state = State.ENDGAME
+                if self.game.journal is not None:
+                    self.game.journal.mob_moved(mob_coords, mob_move_coords)
 
     def check_move(
         self,
@@ -304,18 +759,40 @@ class MapStateHandler(StateHandler):
         y = from_y + dy
         coords = x, y
         # The exit is a special case - it's considered "occupied" but you can move there
-        # And yes, mobs can stand on it and hide it :)
+        # And yes, mobs can stand on it and hide it :) But only one at a time,
+        # and not on the player, who stands on it after going back down.
         exit_coords = self.game.exit_x, self.game.exit_y
         if coords == exit_coords:
+            if allow_attack:
+                return coords, 'move', None
+            if coords in self.game.mobs or coords == (self.game.player_x, self.game.player_y):
+                return coords, None, None
             return coords, 'move', None
         if allow_attack:
             attack_target = self.game.mobs.get(coords)
             if attack_target:
                 return coords, 'attack', attack_target
-        if not is_wall(x, y, self.game.map_tiles) and coords not in self.game.occupied_coords:
+            # Only the player opens doors, by walking into them.
+            if in_map(x, y, self.game.tile_codes) and self.game.tile_codes[y, x] == DOOR:
+                return coords, 'open', None
+        if is_walkable(x, y, self.game.fov_map.walkable) and coords not in self.game.occupied_coords:
             return coords, 'move', None
         return coords, None, None
 
+    def check_verb(self, dx: int, dy: int, verb: str) -> Tuple[Tuple[int, int], Optional[str], None]:
+        x = self.game.player_x + dx
+        y = self.game.player_y + dy
+        coords = x, y
+        if not in_map(x, y, self.game.tile_codes):
+            return coords, None, None
+        tile_code = self.game.tile_codes[y, x]
+        if verb == 'dig' and tile_code == WALL:
+            return coords, 'dig', None
+        # A door with something in the way won't close.
+        if verb == 'close' and tile_code == OPEN_DOOR and coords not in self.game.occupied_coords:
+            return coords, 'close', None
+        return coords, None, None
+
 
 class EndgameStateHandler(StateHandler):
 
@@ -327,153 +804,665 @@ class EndgameStateHandler(StateHandler):
 
     def ev_keydown(self, event):
         if event.scancode == tcod.event.SCANCODE_F:
-            fullscreen = not tcod.console_is_fullscreen()
-            tcod.console_set_fullscreen(fullscreen)
+            self.toggle_fullscreen()
         elif event.scancode == tcod.event.SCANCODE_Q:
             self.next_state = None  # quit
+        elif event.scancode == tcod.event.SCANCODE_U:
+            if rewind(self.game, 1):
+                self.next_state = State.MAP  # take back the last move
         elif event.scancode == tcod.event.SCANCODE_R:
             self.next_state = State.MAP  # restart
-            self.game = build_game(self.game.root_console, self.game.draw_console)
+            self.game = build_game(
+                self.game.root_console,
+                self.game.draw_console,
+                backend=self.game.backend,
+                timings=self.game.timings,
+                seed=self.game.rng.next_seed(),
+                recorder=self.game.recorder,
+                config=self.game.config,
+                profiler=self.game.profiler,
+                autosaver=self.game.autosaver,
+                journal=self.game.journal,
+                history=self.game.history,
+                dungeon=self.game.dungeon
+            )
+
+
+STATE_HANDLERS = {
+    State.MAP: MapStateHandler,
+    State.ENDGAME: EndgameStateHandler,
+}
+
+# Ticks simulated back to back before the fixed timestep loop gives up on
+# catching up with the wall clock.
+MAX_CATCH_UP_TICKS = 5
+
+# The states each state may hand off to, where None means quit. A state
+# listing itself may keep running, which re-enters it after every input batch.
+TRANSITIONS: Dict[State, Set[Optional[State]]] = {
+    State.MAP: {State.MAP, State.ENDGAME, None},
+    State.ENDGAME: {State.ENDGAME, State.MAP, None},
+}
+
+
+class StateMachine:
+    """
+    Runs state handlers, creating each one once and reusing it every time its
+    state is entered. Counts transitions and totals the time spent per state.
+    """
+
+    def __init__(
+            self,
+            state_handlers: Dict[State, Type[StateHandler]],
+            transitions: Dict[State, Set[Optional[State]]] = TRANSITIONS
+    ) -> None:
+        for state, targets in transitions.items():
+            if state not in state_handlers:
+                raise ValueError(f'No handler for state {state}')
+            for target in targets:
+                if target is not None and target not in transitions:
+                    raise ValueError(f'Transition {state} -> {target} leads to an undeclared state')
+        for state in state_handlers:
+            if state not in transitions:
+                raise ValueError(f'No transitions declared for state {state}')
+        self.state_handlers = state_handlers
+        self.transitions = transitions
+        self.transition_counts: Counter = Counter()  # (from, to) -> count
+        self.dwell_times: Dict[State, float] = defaultdict(float)  # seconds
+        self.handlers: Dict[State, StateHandler] = {}
+        self.state: Optional[State] = None
+        self._entered_at = 0.0
+
+    @property
+    def game(self) -> Game:
+        """The game the current (or, after quitting, last) state is playing."""
+        return self.handlers[self.state].game
+
+    def run(
+            self,
+            state: State,
+            game: Game,
+            metrics: Optional[MetricsExporter] = None
+    ) -> None:
+        """Block for input, then update and redraw once per input batch."""
+        handler = self._start(state, game, metrics)
+        while handler is not None:
+            if metrics is not None:
+                metrics.tick(handler.game)
+            next_state, game = handler.handle()
+            input_at = handler.input_at
+            handler = self._advance(handler, next_state, game)
+            if game.timings.enabled:
+                game.timings.record('latency', perf_counter() - input_at)
+
+    def run_fixed(
+            self,
+            state: State,
+            game: Game,
+            tick_rate: float,
+            metrics: Optional[MetricsExporter] = None
+    ) -> None:
+        """
+        Advance the simulation tick_rate times per second whether or not there
+        is input, sleeping until the next tick or input event in between.
+        """
+        dt = 1 / tick_rate
+        handler = self._start(state, game, metrics)
+        next_tick = perf_counter() + dt
+        while handler is not None:
+            if metrics is not None:
+                metrics.tick(handler.game)
+            timeout = max(0.0, next_tick - perf_counter())
+            events = list(wait_for_events(handler.game, timeout))
+            input_at = perf_counter()
+            handler.dispatch_batch(events, input_at)
+            changed = bool(events)
+            now = perf_counter()
+            ticks = 0
+            while now >= next_tick and handler.next_state == self.state:
+                changed = handler.update(dt) or changed
+                next_tick += dt
+                ticks += 1
+                if ticks == MAX_CATCH_UP_TICKS:
+                    # Too far behind to catch up, so drop the backlog rather
+                    # than spending ever longer simulating.
+                    next_tick = now + dt
+            if changed or handler.next_state != self.state:
+                game = handler.game
+                handler = self._advance(handler, handler.next_state, game)
+                if events and game.timings.enabled:
+                    game.timings.record('latency', perf_counter() - input_at)
+
+    def _start(
+            self,
+            state: State,
+            game: Game,
+            metrics: Optional[MetricsExporter]
+    ) -> StateHandler:
+        if metrics is not None:
+            game.timings.collect()  # exported frame and phase times need it
+        self.handlers = {
+            handler_state: handler_class(handler_state, game)
+            for handler_state, handler_class in self.state_handlers.items()
+        }
+        self.state = state
+        self._entered_at = perf_counter()
+        handler = self.handlers[state]
+        with game.timings.phase('frame'):
+            handler.on_enter_state()
+        return handler
+
+    def _advance(
+            self,
+            handler: StateHandler,
+            next_state: Optional[State],
+            game: Game
+    ) -> Optional[StateHandler]:
+        """Move to next_state, returning its handler, or None when quitting."""
+        if game.profiler.active:
+            report_profile(game, game.profiler.tick(game.turns))
+        if game.autosaver is not None:
+            game.autosaver.tick(game)
+        state = self.state
+        if next_state not in self.transitions[state]:
+            raise ValueError(f'Undeclared transition {state} -> {next_state}')
+        self.transition_counts[state, next_state] += 1
+        if next_state == state:
+            handler.game = game
+            with game.timings.phase('frame'):
+                handler.on_reenter_state()
+            return handler
+        now = perf_counter()
+        self.dwell_times[state] += now - self._entered_at
+        self._entered_at = now
+        handler.on_exit_state()
+        if next_state is None:
+            report_profile(game, game.profiler.stop())
+            return None
+        self.state = next_state
+        handler = self.handlers[next_state]
+        handler.next_state = next_state
+        handler.game = game
+        with game.timings.phase('frame'):
+            handler.on_enter_state()
+        return handler
 
 
 def run_fsm(
-        state_handlers: Dict[State, StateHandler],
+        state_handlers: Dict[State, Type[StateHandler]],
         state: State,
-        game: Game
-) -> None:
-    last_state = None
-    while state is not None:
-        handler_class = state_handlers[state]
-        handler = handler_class(state, game)
-        if state == last_state:
-            handler.on_reenter_state()
+        game: Game,
+        metrics: Optional[MetricsExporter] = None,
+        tick_rate: Optional[float] = None
+) -> StateMachine:
+    """
+    Run the game until a handler quits. By default the game only advances on
+    input; pass a tick_rate to also advance on a fixed timestep. The caller
+    closes metrics, which gets a last export when the game ends.
+    """
+    machine = StateMachine(state_handlers)
+    try:
+        if tick_rate is None:
+            machine.run(state, game, metrics)
         else:
-            handler.on_enter_state()
-        last_state = state
-        state, game = handler.handle()
+            machine.run_fixed(state, game, tick_rate, metrics)
+    finally:
+        if metrics is not None and machine.state is not None:
+            metrics.tick(machine.game, force=True)  # the last, partial interval
+    return machine
+
+
+def game_hash(game: Game) -> bytes:
+    """SHA-256 of everything that makes up the state of play."""
+    digest = hashlib.sha256()
+    digest.update(repr((
+        game.player_x,
+        game.player_y,
+        game.player_hp,
+        game.exit_x,
+        game.exit_y,
+        game.won,
+        game.turns,
+        sorted((coords, mob.hp) for coords, mob in game.mobs.items()),
+        game.messages,
+    )).encode())
+    digest.update(game.tile_codes.tobytes())
+    digest.update(np.packbits(game.memory.to_array()).tobytes())
+    return digest.digest()
+
 
+def build_map(
+        width: int,
+        height: int,
+        rng: np.random.Generator,
+        walk_length: int = 10000
+) -> List[List[str]]:
+    floor = carve_cave(width, height, rng, walk_length)
+    return np.where(floor, '.', '#').tolist()
 
-def build_map(width: int, height: int) -> List[List[str]]:
+
+def carve_cave(
+        width: int,
+        height: int,
+        rng: np.random.Generator,
+        walk_length: int = 10000
+) -> np.ndarray:
+    """
+    Carve floor with a random walk that never touches the edge of the map.
+    Returns a boolean array that is True for floor, indexed [y, x].
+    """
     # start with all walls
-    map_tiles = [['#'] * width for y in range(height)]
+    floor = np.zeros((height, width), dtype=bool)
     # choose a random starting point
-    x = random.randint(1, width - 2)
-    y = random.randint(1, height - 2)
-    # walk in a random direction
-    possible_moves = [(0, -1), (0, 1), (-1, 0), (1, 0)]
-    map_tiles[y][x] = '.'
-    for i in range(10000):
-        choice = random.randint(0, len(possible_moves) - 1)
-        dx, dy = possible_moves[choice]
-        if 0 < x + dx < width - 1 and 0 < y + dy < height - 1:
-            x = x + dx
-            y = y + dy
-        map_tiles[y][x] = '.'
-    return map_tiles
-
-
-def is_wall(
+    x = int(rng.integers(1, width - 1))
+    y = int(rng.integers(1, height - 1))
+    floor[y, x] = True
+    # walk in a random direction, drawing all the steps up front
+    possible_moves = np.array([(0, -1), (0, 1), (-1, 0), (1, 0)])
+    moves = rng.integers(len(possible_moves), size=walk_length).astype(np.uint8)
+    # Take the steps a chunk at a time with cumsum. A step that would reach
+    # the edge is skipped (the walker stays put), so a chunk ends there.
+    i = 0
+    chunk = 64
+    while i < walk_length:
+        path = np.cumsum(possible_moves[moves[i:i + chunk]], axis=0) + (x, y)
+        outside = (
+            (path[:, 0] <= 0) | (path[:, 0] >= width - 1)
+            | (path[:, 1] <= 0) | (path[:, 1] >= height - 1)
+        )
+        stop = int(np.argmax(outside)) if outside.any() else len(path)
+        if stop:
+            floor[path[:stop, 1], path[:stop, 0]] = True
+            x, y = (int(n) for n in path[stop - 1])
+        if stop < len(path):
+            i += stop + 1  # skip the step that would have left the map
+            chunk = 64
+        else:
+            i += stop
+            chunk = min(chunk * 2, 65536)
+    return floor
+
+
+def in_map(
     x: int,
     y: int,
-    map_tiles: List[List[str]]
+    tiles: np.ndarray
+) -> bool:
+    height, width = tiles.shape
+    return 0 <= x < width and 0 <= y < height
+
+
+def is_walkable(
+    x: int,
+    y: int,
+    walkable: np.ndarray
 ) -> bool:
-    height = len(map_tiles)
-    width = len(map_tiles[0])
     # Is it even in the map?
-    if not 0 <= x < width:
-        return True
-    if not 0 <= y < height:
-        return True
-    # Is it a wall tile?
-    tile = map_tiles[y][x]
-    return tile == '#'
+    if not in_map(x, y, walkable):
+        return False
+    # Is it floor, an open door, etc.?
+    return walkable[y, x]
+
+
+def step_towards(from_coords: Tuple[int, int], to_coords: Tuple[int, int]) -> Tuple[int, int]:
+    """The move along the axis that is farther from to_coords."""
+    dx = to_coords[0] - from_coords[0]
+    dy = to_coords[1] - from_coords[1]
+    if abs(dx) >= abs(dy):
+        return (dx > 0) - (dx < 0), 0
+    return 0, (dy > 0) - (dy < 0)
 
 
 def place_randomly(
-    map_tiles: List[List[str]],
-    occupied_coords: Set[Tuple[int, int]]
-) -> Tuple[int, int]:
-    height = len(map_tiles)
-    width = len(map_tiles[0])
-    coords = None, None
-    tile = '#'
-    while tile != '.' and coords not in occupied_coords:
-        x = random.randint(1, width - 2)
-        y = random.randint(1, height - 2)
-        coords = x, y
-        tile = map_tiles[y][x]
-    occupied_coords.add(coords)
-    return coords
+    floor: np.ndarray,
+    count: int,
+    rng: np.random.Generator
+) -> List[Tuple[int, int]]:
+    """Choose count distinct floor tiles in one draw."""
+    spots = np.flatnonzero(floor)
+    if len(spots) < count:
+        raise ValueError(f'Only {len(spots)} floor tiles for {count} things to place')
+    chosen = rng.choice(spots, size=count, replace=False)
+    ys, xs = np.divmod(chosen, floor.shape[1])
+    return list(zip(xs.tolist(), ys.tolist()))
 
 
 def build_game(
         root_console: tcod.console.Console,
-        draw_console: tcod.console.Console
+        draw_console: tcod.console.Console,
+        backend: Optional[Backend] = None,
+        timings: Optional[Timings] = None,
+        seed: Optional[int] = None,
+        recorder: Optional[Recorder] = None,
+        config: Optional[GameConfig] = None,
+        profiler: Optional[Profiler] = None,
+        autosaver: Optional[Autosaver] = None,
+        journal: Optional[Journal] = None,
+        history: Optional[History] = None,
+        dungeon: Optional[Dungeon] = None
 ) -> Game:
+    config = config if config is not None else GameConfig()
+    rng = RngService(seed)
+    tile_codes, (player_x, player_y), (exit_x, exit_y), mobs = generate_level(config, rng.mapgen, rng.spawns)
+    dungeon = open_dungeon(dungeon, config, rng.seed)
+    return assemble_game(
+        root_console,
+        draw_console,
+        tile_codes,
+        player_x,
+        player_y,
+        exit_x,
+        exit_y,
+        mobs,
+        config,
+        rng,
+        backend=backend,
+        timings=timings,
+        recorder=recorder,
+        profiler=profiler,
+        autosaver=autosaver,
+        journal=journal,
+        history=history,
+        dungeon=dungeon
+    )
+
+
+def generate_level(
+        config: GameConfig,
+        mapgen: np.random.Generator,
+        spawns: np.random.Generator
+) -> Tuple[np.ndarray, Tuple[int, int], Tuple[int, int], Dict[Tuple[int, int], Mob]]:
+    """Return a new level's tile codes, where the player starts, the exit and the mobs."""
+    floor = carve_cave(config.map_width, config.map_height, mapgen, config.walk_steps)
+    tile_codes = np.where(floor, FLOOR, WALL).astype(np.uint8)
+    floor_tiles = int(floor.sum())
+    mob_count = config.mob_count(floor_tiles)
+    if mob_count > floor_tiles - 2:
+        # The walk went over its own tracks too often to fit them all.
+        warnings.warn(f'Only room for {floor_tiles - 2} of the {mob_count} mobs', RuntimeWarning)
+        mob_count = floor_tiles - 2
+    coords = place_randomly(floor, mob_count + 2, spawns)
+    mobs = {mob_coords: Mob(config.mob_hp) for mob_coords in coords[2:]}
+    if config.doors:
+        place_doors(tile_codes, floor, coords, config.doors, spawns)
+    return tile_codes, coords[0], coords[1], mobs
+
+
+def place_doors(
+    tile_codes: np.ndarray,
+    floor: np.ndarray,
+    occupied: List[Tuple[int, int]],
+    count: int,
+    rng: np.random.Generator
+) -> None:
+    """Close up to count of the narrow passages, i.e. floor between two walls."""
+    padded = np.pad(floor, 1)  # outside the map is wall
+    left, right = padded[1:-1, :-2], padded[1:-1, 2:]
+    up, down = padded[:-2, 1:-1], padded[2:, 1:-1]
+    doorway = floor & ((~left & ~right & up & down) | (left & right & ~up & ~down))
+    xs, ys = np.array(occupied).T
+    doorway[ys, xs] = False
+    ys, xs = np.nonzero(doorway)
+    chosen = rng.choice(len(ys), size=min(count, len(ys)), replace=False)
+    tile_codes[ys[chosen], xs[chosen]] = DOOR
+
+
+def build_level(
+        config: GameConfig,
+        seed: int,
+        number: int,
+        saved: Optional[Dict[str, np.ndarray]] = None
+) -> Level:
+    """
+    Generate level number of the game with this seed, or rebuild it from the
+    arrays a Dungeon spilled to disk. Every level has its own random streams,
+    so it comes out the same whenever, and on whichever thread, it is built.
+    """
+    if saved is None:
+        if number == 0:
+            rng = RngService(seed)  # as in build_game()
+            mapgen, spawns = rng.mapgen, rng.spawns
+        else:
+            mapgen = spawns = np.random.default_rng([seed, number])
+        tile_codes, (entrance_x, entrance_y), (exit_x, exit_y), mobs = generate_level(config, mapgen, spawns)
+        memory = BitMemory(*tile_codes.shape)
+    else:
+        tile_codes = saved['tile_codes']
+        mob_coords = saved['mob_coords'].tolist()
+        mob_hp = saved['mob_hp'].tolist()
+        mobs = {(x, y): Mob(hp) for (x, y), hp in zip(mob_coords, mob_hp)}
+        memory = BitMemory.from_array(saved['memory'])
+        exit_x, exit_y, entrance_x, entrance_y = saved['stairs'].tolist()
+    occupied_coords = set(mobs)
+    occupied_coords.add((exit_x, exit_y))
+    return Level(
+        tile_codes=tile_codes,
+        occupied_coords=occupied_coords,
+        mobs=mobs,
+        fov_map=make_fov_map(tile_codes),
+        memory=memory,
+        exit_x=exit_x,
+        exit_y=exit_y,
+        entrance_x=entrance_x if number else None,
+        entrance_y=entrance_y if number else None
+    )
+
+
+def open_dungeon(
+        dungeon: Optional[Dungeon],
+        config: GameConfig,
+        seed: int,
+        level: int = 0,
+        visited: Optional[Dict[int, Dict[str, np.ndarray]]] = None
+) -> Optional[Dungeon]:
+    """
+    Start keeping the levels of a game, if it has more than one, with the
+    player on level and the other levels visited, if any, as saved.
+    """
+    if config.levels == 1:
+        return None
+    dungeon = dungeon if dungeon is not None else Dungeon()
+    dungeon.reset(partial(build_level, config, seed), config.levels, level, visited)
+    return dungeon
+
+
+def compute_fov(game: Game) -> FieldOfView:
+    """Update what the player can see from where they stand."""
+    game.fov = field_of_view(
+        game.fov_map.transparent,
+        game.player_x,
+        game.player_y,
+        game.config.fov_radius,
+        game.tile_changes.version
+    )
+    return game.fov
+
+
+def make_fov_map(tile_codes: np.ndarray) -> tcod.map.Map:
+    map_height, map_width = tile_codes.shape
+    fov_map = tcod.map.Map(map_width, map_height)
+    # Floor and open doors can be walked on and seen through, walls and
+    # closed doors can't.
+    fov_map.walkable[:], fov_map.transparent[:] = derive(tile_codes)
+    return fov_map
+
+
+def assemble_game(
+        root_console: tcod.console.Console,
+        draw_console: tcod.console.Console,
+        tile_codes: np.ndarray,
+        player_x: int,
+        player_y: int,
+        exit_x: int,
+        exit_y: int,
+        mobs: Dict[Tuple[int, int], Mob],
+        config: GameConfig,
+        rng: RngService,
+        memory: Optional[BitMemory] = None,
+        backend: Optional[Backend] = None,
+        timings: Optional[Timings] = None,
+        recorder: Optional[Recorder] = None,
+        profiler: Optional[Profiler] = None,
+        autosaver: Optional[Autosaver] = None,
+        journal: Optional[Journal] = None,
+        history: Optional[History] = None,
+        dungeon: Optional[Dungeon] = None
+) -> Game:
+    """
+    Put a game together around a map and what's on it, whether freshly
+    generated or loaded. Without a memory, the player remembers only what
+    they can see.
+    """
     stats_width = 20
     stats_height = 10
     dialog_width = CONSOLE_WIDTH - stats_width
     dialog_height = stats_height
-    map_width = CONSOLE_WIDTH
-    map_height = CONSOLE_HEIGHT - dialog_height
-    map_tiles = build_map(map_width, map_height)
-    occupied_coords = set()
-    player_x, player_y = place_randomly(map_tiles, occupied_coords)
-    exit_x, exit_y = place_randomly(map_tiles, occupied_coords)
-    mobs = {}
-    for i in range(25):
-        mob_coords = place_randomly(map_tiles, occupied_coords)
-        mobs[mob_coords] = Mob(5)
-    fov_map = tcod.map.Map(map_width, map_height)
-    # Transparent tiles are everything except the walls.
-    for y, row in enumerate(map_tiles):
-        for x, tile in enumerate(row):
-            if tile != '#':
-                fov_map.transparent[y][x] = True
-    fov_map.compute_fov(player_x, player_y, 10)
-    memory = np.copy(fov_map.fov)
+    map_height, map_width = tile_codes.shape
+    occupied_coords = set(mobs)
+    occupied_coords.update([(player_x, player_y), (exit_x, exit_y)])
+    fov_map = make_fov_map(tile_codes)
+    fov = field_of_view(fov_map.transparent, player_x, player_y, config.fov_radius)
+    if memory is None:
+        memory = BitMemory(map_height, map_width)
+        memory.or_in(fov.x, fov.y, fov.visible)
     return Game(
         root_console=root_console,
         draw_console=draw_console,
         player_x=player_x,
         player_y=player_y,
-        player_hp=10,
-        map_tiles=map_tiles,
+        player_hp=config.player_hp,
+        tile_codes=tile_codes,
         occupied_coords=occupied_coords,
         mobs=mobs,
         fov_map=fov_map,
+        fov=fov,
         memory=memory,
         exit_x=exit_x,
         exit_y=exit_y,
         map_width=map_width,
         map_height=map_height,
+        view_width=min(map_width, CONSOLE_WIDTH),
+        view_height=min(map_height, CONSOLE_HEIGHT - dialog_height),
         dialog_width=dialog_width,
         dialog_height=dialog_height,
         stats_width=stats_width,
-        stats_height=stats_height
+        stats_height=stats_height,
+        backend=backend,
+        timings=timings if timings is not None else Timings(),
+        rng=rng,
+        recorder=recorder,
+        config=config,
+        profiler=profiler if profiler is not None else Profiler(),
+        autosaver=autosaver,
+        journal=journal,
+        history=history,
+        dungeon=dungeon
     )
 
 
-def main():
+def load_game(
+        path: str,
+        root_console: tcod.console.Console,
+        draw_console: tcod.console.Console,
+        backend: Optional[Backend] = None,
+        timings: Optional[Timings] = None,
+        profiler: Optional[Profiler] = None,
+        autosaver: Optional[Autosaver] = None,
+        journal: Optional[Journal] = None,
+        history: Optional[History] = None,
+        dungeon: Optional[Dungeon] = None
+) -> Game:
+    """Resume a game saved with savegame.save_game() or autosaved."""
+    header, arrays = savegame.read_save(path)
+    mob_coords = arrays['mob_coords'].tolist()
+    mob_hp = arrays['mob_hp'].tolist()
+    config = GameConfig(**header['config'])
+    rng = RngService.from_state(header['rng'])
+    dungeon = open_dungeon(dungeon, config, rng.seed, header.get('level', 0), arrays['levels'])
+    game = assemble_game(
+        root_console,
+        draw_console,
+        arrays['tile_codes'],
+        header['player_x'],
+        header['player_y'],
+        header['exit_x'],
+        header['exit_y'],
+        {(x, y): Mob(hp) for (x, y), hp in zip(mob_coords, mob_hp)},
+        config,
+        rng,
+        memory=BitMemory.from_array(arrays['memory']),
+        backend=backend,
+        timings=timings,
+        profiler=profiler,
+        autosaver=autosaver,
+        journal=journal,
+        history=history,
+        dungeon=dungeon
+    )
+    game.player_hp = header['player_hp']
+    game.messages = header['messages']
+    game.won = header['won']
+    game.turns = header['turns']
+    game.level = header.get('level', 0)
+    game.entrance_x = header.get('entrance_x')
+    game.entrance_y = header.get('entrance_y')
+    return game
+
+
+def recover_game(
+        directory: str,
+        root_console: tcod.console.Console,
+        draw_console: tcod.console.Console,
+        backend: Optional[Backend] = None,
+        timings: Optional[Timings] = None,
+        profiler: Optional[Profiler] = None,
+        autosaver: Optional[Autosaver] = None,
+        journal: Optional[Journal] = None,
+        history: Optional[History] = None,
+        dungeon: Optional[Dungeon] = None
+) -> Game:
+    """Resume a journaled game: load the newest base and replay the journal on it."""
+    base, logs = latest_base(directory)
+    if base is None:
+        raise ValueError(f'No journal in {directory}')
+    game = load_game(
+        base,
+        root_console,
+        draw_console,
+        backend=backend,
+        timings=timings,
+        profiler=profiler,
+        autosaver=autosaver,
+        journal=journal,
+        history=history,
+        dungeon=dungeon
+    )
+    apply_records(game, logs)
+    compute_fov(game)
+    return game
+
+
+def open_window(title: str = 'FSM Game') -> tcod.console.Console:
+    """Open the SDL window. Use the root console it returns as a context manager."""
     tcod.console_set_custom_font(
         'arial10x10.png',
         tcod.FONT_LAYOUT_TCOD | tcod.FONT_TYPE_GREYSCALE,
     )
-    with tcod.console_init_root(
-            CONSOLE_WIDTH,
-            CONSOLE_HEIGHT,
-            order='F',
-            renderer=tcod.RENDERER_SDL2,
-            title='FSM Game',
-            vsync=True
-    ) as root_console:
+    return tcod.console_init_root(
+        CONSOLE_WIDTH,
+        CONSOLE_HEIGHT,
+        order='F',
+        renderer=tcod.RENDERER_SDL2,
+        title=title,
+        vsync=True
+    )
+
+
+def main():
+    with open_window() as root_console:
         draw_console = tcod.console.Console(CONSOLE_WIDTH, CONSOLE_HEIGHT, order='F')
-        my_state_handlers = {
-            State.MAP: MapStateHandler,
-            State.ENDGAME: EndgameStateHandler,
-        }
         game = build_game(root_console, draw_console)
-        run_fsm(my_state_handlers, State.MAP, game)
+        run_fsm(STATE_HANDLERS, State.MAP, game)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,186 @@
+"""
+Keep the last few turns of a game so they can be undone, e.g. to rewind a
+fatal mistake or step back while debugging.
+
+Nothing is deep copied. Before a turn changes something, the game hands its
+old value to the history: a copy of each CHUNK x CHUNK block of an array the
+first time the turn writes to it, the memory chunks it replaces (which are
+never changed in place, so are kept as they are), and the old hit points and
+coordinates of each mob entry it changes. Everything else stays shared with the live game,
+so a turn costs memory in proportion to what it changed, not to the level's
+size, and rewinding puts back only the blocks and mobs that changed since.
+
+Mobs take their turns, and their AI draws, in the order of game.mobs, which
+is the order they last moved in. So the history numbers the mobs in that
+order, and a rewind puts the ones it brings back in their old places.
+"""
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from terrain import refresh
+
+CHUNK = 32
+
+
+@dataclass
+class Frame:
+    """The state before one turn, as far as the turn changed it."""
+    player: Tuple[int, int, int]
+    turns: int
+    won: Optional[bool]
+    message_count: int
+    rng: Dict[str, Any]
+    # (array name, chunk row, chunk column) -> the block before the turn
+    chunks: Dict[Tuple[str, int, int], np.ndarray] = field(default_factory=dict)
+    # memory chunk key -> the chunk before the turn, None if there was none
+    memory: Dict[Tuple[int, int], Optional[np.ndarray]] = field(default_factory=dict)
+    # (coords, mob or None if there was none, its hit points, its place in
+    # the turn order) in the order changed
+    mobs: List[Tuple[Tuple[int, int], Any, int, Optional[int]]] = field(default_factory=list)
+
+
+class History:
+
+    def __init__(self, turns: int = 100) -> None:
+        if turns < 1:
+            raise ValueError('History must keep at least one turn')
+        self.turns = turns  # how many turns can be rewound
+        self.game = None
+        self.frames: Deque[Frame] = deque(maxlen=turns)
+        self.frame: Optional[Frame] = None  # the turn in progress
+        # coords -> place in the game's mobs, for putting mobs back in order
+        self.order: Optional[Dict[Tuple[int, int], int]] = None
+        self.placed = 0  # places handed out so far
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def begin(self, game) -> None:
+        """Call before a turn changes anything."""
+        if game is not self.game:
+            self.game = game  # a new game after a restart, load, etc.
+            self.clear()
+        if self.order is None:
+            self.order = {coords: place for place, coords in enumerate(game.mobs)}
+            self.placed = len(self.order)
+        self.frame = Frame(
+            player=(game.player_x, game.player_y, game.player_hp),
+            turns=game.turns,
+            won=game.won,
+            message_count=len(game.messages),
+            rng={name: stream.bit_generator.state for name, stream in game.rng.streams.items()},
+        )
+
+    def clear(self) -> None:
+        self.frames.clear()
+        self.frame = None
+        self.order = None
+
+    def commit(self) -> None:
+        """Call once the turn is over."""
+        if self.frame is not None:
+            # A mob that arrived on a tile went to the end of the game's
+            # mobs, as of the last change to the tile.
+            last_change: Dict[Tuple[int, int], Any] = {}
+            for coords, mob, _, _ in self.frame.mobs:
+                last_change.pop(coords, None)
+                last_change[coords] = mob
+            for coords, mob in last_change.items():
+                now = self.game.mobs.get(coords)
+                if now is None:
+                    self.order.pop(coords, None)
+                elif now is not mob:
+                    self.order[coords] = self.placed
+                    self.placed += 1
+            self.frames.append(self.frame)
+            self.frame = None
+
+    # Called by the game before it changes things during a turn.
+
+    def array_changing(self, name: str, x: int, y: int, width: int, height: int) -> None:
+        """The game's array attribute name is about to change within this box."""
+        array = getattr(self.game, name)
+        chunks = self.frame.chunks
+        for row in range(y // CHUNK, (y + height - 1) // CHUNK + 1):
+            for column in range(x // CHUNK, (x + width - 1) // CHUNK + 1):
+                if (name, row, column) not in chunks:
+                    block = np.s_[row * CHUNK:(row + 1) * CHUNK, column * CHUNK:(column + 1) * CHUNK]
+                    chunks[name, row, column] = array[block].copy()
+
+    def memory_changing(self, x: int, y: int, width: int, height: int) -> None:
+        """The game's memory is about to change within this box."""
+        memory = self.game.memory
+        for key in memory.keys(x, y, width, height):
+            if key not in self.frame.memory:
+                self.frame.memory[key] = memory.chunks.get(key)
+
+    def mob_changing(self, coords: Tuple[int, int]) -> None:
+        """The mob at coords, or the lack of one, is about to change."""
+        mob = self.game.mobs.get(coords)
+        if mob is None:
+            self.frame.mobs.append((coords, None, 0, None))
+        else:
+            self.frame.mobs.append((coords, mob, mob.hp, self.order[coords]))
+
+    def rewind(self, game, turns: int = 1) -> int:
+        """Undo up to turns turns of game. Returns how many were undone."""
+        if game is not self.game:
+            return 0
+        self.frame = None
+        undone = 0
+        put_back = set()
+        while undone < turns and self.frames:
+            frame = self.frames.pop()
+            undo(game, frame, self.order)
+            put_back.update(coords for coords, _, _, _ in frame.mobs)
+            undone += 1
+        places = [self.order[coords] for coords in put_back if coords in game.mobs]
+        if places:
+            reorder(game.mobs, self.order, min(places))
+        return undone
+
+
+def reorder(mobs: Dict[Tuple[int, int], Any], order: Dict[Tuple[int, int], int], first: int) -> None:
+    """Put mobs in the order of their places again, when none before place first is out of it."""
+    # Mobs put back went to the end, and the rest are still in order, so
+    # only those from the first place on have to be taken out and put back.
+    coords = list(mobs)
+    start = len(coords)
+    while start and order[coords[start - 1]] >= first:
+        start -= 1
+    tail = sorted(coords[start:], key=order.__getitem__)
+    mobs.update([(key, mobs.pop(key)) for key in tail])
+
+
+def undo(game, frame: Frame, order: Dict[Tuple[int, int], int]) -> None:
+    # Oldest last, so each entry ends up as it was before its first change.
+    for coords, mob, hp, place in reversed(frame.mobs):
+        if mob is None:
+            game.mobs.pop(coords, None)
+            game.occupied_coords.discard(coords)
+            order.pop(coords, None)
+        else:
+            mob.hp = hp
+            game.mobs[coords] = mob
+            game.occupied_coords.add(coords)
+            order[coords] = place
+    # The player moves before the mobs do, so goes back after them.
+    game.occupied_coords.discard((game.player_x, game.player_y))
+    game.player_x, game.player_y, game.player_hp = frame.player
+    game.occupied_coords.add((game.player_x, game.player_y))
+    for (name, row, column), block in frame.chunks.items():
+        height, width = block.shape
+        getattr(game, name)[row * CHUNK:row * CHUNK + height, column * CHUNK:column * CHUNK + width] = block
+        if name == 'tile_codes':
+            refresh(game, column * CHUNK, row * CHUNK, width, height)
+    for key, chunk in frame.memory.items():
+        game.memory.replace(key, chunk)
+    game.occupied_coords.add((game.exit_x, game.exit_y))
+    game.turns = frame.turns
+    game.won = frame.won
+    del game.messages[frame.message_count:]
+    for name, state in frame.rng.items():
+        game.rng.streams[name].bit_generator.state = state
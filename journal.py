@@ -0,0 +1,292 @@
+"""
+An append-only journal of per-turn deltas, so that persisting a huge level
+costs I/O in proportion to what changed rather than to the level's size.
+
+A journal directory holds numbered segments. base-N.pmsv is a full save and
+journal-N.log the turns played after it. Every `compact_every` turns the
+current state is snapshotted, a new segment begins, and the base is written
+in the background; older segments are deleted once it is safely on disk.
+Until then, the new segment carries on from the end of the last one. A
+segment begun for any other reason (a new game, another level, a rewind)
+does not, and is only good on top of its own base.
+
+Each segment starts with the magic, the version and whether it carries on
+from the last one (u8 each).
+
+Each turn appends one record:
+
+    payload length (u32), crc32 of payload (u32), payload
+    payload = JSON length (u32), JSON, ops (int32 x 5 each), memory bits
+
+The JSON holds the player, turn count, outcome, new messages, the RNG
+streams that advanced and where the new memory bits go. Ops are changes in
+the order they happened: a mob moving, its hit points changing, its death,
+or a tile changing (a door opening or closing, a wall dug through). Memory bits are the tiles newly seen this turn, packed 8 to a byte.
+
+Recovery loads the newest base and replays the records after it, through
+the segments that carry on from it, stopping at the first torn or corrupt
+record, i.e. whatever was being written at a crash.
+"""
+import glob
+from itertools import chain
+import json
+import os
+import queue
+import re
+import struct
+import threading
+import zlib
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import savegame
+from terrain import set_tile
+
+MAGIC = b'PMJL'
+VERSION = 2
+VERSIONS = (1, VERSION)  # version 1 segments always carried on
+FRAME = struct.Struct('<II')
+LENGTH = struct.Struct('<I')
+
+# Op codes, followed by x, y and two operands
+MOVE = 0  # to x, to y
+HP = 1  # hit points, unused
+DIE = 2  # unused, unused
+TILE = 3  # tile code, unused
+
+
+class Journal:
+
+    def __init__(self, directory: str = 'journal', compact_every: int = 1000, sync: bool = False) -> None:
+        if compact_every < 1:
+            raise ValueError('Compaction interval must be positive')
+        self.directory = directory
+        self.compact_every = compact_every  # turns per segment
+        self.sync = sync  # fsync after every turn, not just on compaction
+        self.bytes_written = 0
+        self.game = None
+        self.segment = 0
+        self.file: Optional[BinaryIO] = None
+        self._ops: List[Tuple[int, int, int, int, int]] = []
+        self._memory: List[Tuple[int, int, np.ndarray]] = []
+        self._messages_seen = 0
+        self._rng_states: Dict[str, Any] = {}
+        self._segment_turns = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='journal', daemon=True)
+        self._thread.start()
+        os.makedirs(directory, exist_ok=True)
+        existing = segments(directory)
+        self.segment = max(existing) if existing else 0
+
+    # Called by the game as things change during a turn.
+
+    def mob_moved(self, from_coords: Tuple[int, int], to_coords: Tuple[int, int]) -> None:
+        self._ops.append((MOVE, *from_coords, *to_coords))
+
+    def mob_hp(self, coords: Tuple[int, int], hp: int) -> None:
+        self._ops.append((HP, *coords, hp, 0))
+
+    def mob_died(self, coords: Tuple[int, int]) -> None:
+        self._ops.append((DIE, *coords, 0, 0))
+
+    def tile_changed(self, coords: Tuple[int, int], code: int) -> None:
+        self._ops.append((TILE, *coords, code, 0))
+
+    def memory_seen(self, x: int, y: int, seen: np.ndarray) -> None:
+        """seen is a boolean [y, x] window, at x, y, of newly remembered tiles."""
+        self._memory.append((x, y, seen))
+
+    def commit(self, game) -> None:
+        """Call at the end of every turn to append its record."""
+        if game is not self.game:
+            self.compact(game)
+            return
+        header: Dict[str, Any] = {
+            'player': [game.player_x, game.player_y, game.player_hp],
+            'turns': game.turns,
+            'won': game.won,
+            'messages': game.messages[self._messages_seen:],
+            'rng': self._advanced_streams(game),
+            'memory': [[x, y, *seen.shape] for x, y, seen in self._memory],
+        }
+        self._messages_seen = len(game.messages)
+        header_bytes = json.dumps(header).encode()
+        parts = [LENGTH.pack(len(header_bytes)), header_bytes]
+        if self._ops:
+            ops = chain.from_iterable(self._ops)
+            parts.append(np.fromiter(ops, dtype=np.int32, count=5 * len(self._ops)).tobytes())
+        parts.extend(np.packbits(seen).tobytes() for _, _, seen in self._memory)
+        payload = b''.join(parts)
+        record = FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+        self.file.write(record)
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+        self.bytes_written += len(record)
+        self._segment_turns += 1
+        self._ops.clear()
+        self._memory.clear()
+        if self._segment_turns >= self.compact_every:
+            self.compact(game, continues=True)
+
+    def compact(self, game, continues: bool = False) -> None:
+        """
+        Start a new segment from a full snapshot of the game as it is now.
+        Pass continues only if the game is as the journal's records left it,
+        so the new segment can be replayed after the last one if its base is
+        never written.
+        """
+        self.game = game
+        self.segment += 1
+        self._segment_turns = 0
+        self._ops.clear()
+        self._memory.clear()
+        self._messages_seen = len(game.messages)
+        self._rng_states = {}
+        self._advanced_streams(game)
+        if self.file is not None:
+            self.file.close()
+        path = os.path.join(self.directory, f'journal-{self.segment}.log')
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + bytes([VERSION, continues]))
+        self.file.flush()
+        self._queue.put((self.segment, savegame.snapshot(game)))
+
+    def close(self) -> None:
+        """Finish writing the pending base, if any, and close the journal."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self._queue.put(None)
+        self._thread.join()
+
+    def _advanced_streams(self, game) -> Dict[str, Any]:
+        advanced = {}
+        for name, stream in game.rng.streams.items():
+            state = stream.bit_generator.state
+            if state != self._rng_states.get(name):
+                advanced[name] = self._rng_states[name] = state
+        return advanced
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            segment, save = item
+            savegame.write_save(os.path.join(self.directory, f'base-{segment}.pmsv'), save)
+            # The new base is durable, so everything before it can go.
+            for path in glob.glob(os.path.join(self.directory, '*-*.*')):
+                number = segment_number(path)
+                if number is not None and number < segment:
+                    os.remove(path)
+
+
+def segment_number(path: str) -> Optional[int]:
+    match = re.fullmatch(r'(?:base|journal)-(\d+)\.(?:pmsv|log)', os.path.basename(path))
+    return int(match.group(1)) if match else None
+
+
+def segments(directory: str) -> List[int]:
+    numbers = {segment_number(path) for path in glob.glob(os.path.join(directory, '*'))}
+    return sorted(number for number in numbers if number is not None)
+
+
+def latest_base(directory: str) -> Tuple[Optional[str], List[str]]:
+    """The newest base save and the journal segments to replay on top of it."""
+    numbers = segments(directory)
+    bases = [n for n in numbers if os.path.exists(os.path.join(directory, f'base-{n}.pmsv'))]
+    if not bases:
+        return None, []
+    base = bases[-1]
+    logs = []
+    for n in numbers:
+        path = os.path.join(directory, f'journal-{n}.log')
+        if n < base or not os.path.exists(path):
+            continue
+        if n > base and not read_header(path)[1]:
+            break  # its base was never written
+        logs.append(path)
+    return os.path.join(directory, f'base-{base}.pmsv'), logs
+
+
+def read_header(path: str) -> Tuple[int, bool]:
+    """A segment's version, and whether it carries on from the last one."""
+    with open(path, 'rb') as f:
+        data = f.read(6)
+    if len(data) < 5 or data[:4] != MAGIC:
+        raise ValueError(f'{path} is not a journal')
+    if data[4] not in VERSIONS:
+        raise ValueError(f'Unsupported journal version {data[4]}')
+    if data[4] == 1:
+        return 1, True
+    # A segment torn before its header was flushed has no records either.
+    return data[4], len(data) == 6 and bool(data[5])
+
+
+def read_records(path: str) -> List[Tuple[Dict[str, Any], np.ndarray, List[Tuple[int, int, np.ndarray]]]]:
+    """Return a segment's complete records as (header, ops, memory windows)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    version, _ = read_header(path)
+    records = []
+    offset = 5 if version == 1 else 6
+    while offset + FRAME.size <= len(data):
+        length, crc = FRAME.unpack_from(data, offset)
+        payload = data[offset + FRAME.size:offset + FRAME.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break  # torn by a crash
+        offset += FRAME.size + length
+        header_length, = LENGTH.unpack_from(payload)
+        position = LENGTH.size + header_length
+        header = json.loads(payload[LENGTH.size:position])
+        memory = []
+        windows = header['memory']
+        memory_bytes = sum((width * height + 7) // 8 for _, _, height, width in windows)
+        ops = np.frombuffer(payload[position:len(payload) - memory_bytes], dtype=np.int32).reshape(-1, 5)
+        position = len(payload) - memory_bytes
+        for x, y, height, width in windows:
+            size = (width * height + 7) // 8
+            bits = np.unpackbits(np.frombuffer(payload[position:position + size], dtype=np.uint8))
+            memory.append((x, y, bits[:width * height].reshape(height, width).view(bool)))
+            position += size
+        records.append((header, ops, memory))
+    return records
+
+
+def apply_records(game, paths: List[str]) -> int:
+    """Replay journal segments onto a game loaded from their base. Returns turns replayed."""
+    replayed = 0
+    for path in paths:
+        for header, ops, memory in read_records(path):
+            # The player moves before the mobs do. The exit stays occupied
+            # when either steps off it.
+            exit_coords = game.exit_x, game.exit_y
+            if (game.player_x, game.player_y) != exit_coords:
+                game.occupied_coords.remove((game.player_x, game.player_y))
+            game.player_x, game.player_y, game.player_hp = header['player']
+            game.occupied_coords.add((game.player_x, game.player_y))
+            for op, x, y, a, b in ops.tolist():
+                if op == MOVE:
+                    game.mobs[a, b] = game.mobs.pop((x, y))
+                    if (x, y) != exit_coords:
+                        game.occupied_coords.remove((x, y))
+                    game.occupied_coords.add((a, b))
+                elif op == HP:
+                    game.mobs[x, y].hp = a
+                elif op == DIE:
+                    del game.mobs[x, y]
+                    game.occupied_coords.remove((x, y))
+                elif op == TILE:
+                    set_tile(game, x, y, a)
+            for x, y, seen in memory:
+                game.memory.or_in(x, y, seen)
+            game.turns = header['turns']
+            game.won = header['won']
+            game.messages.extend(header['messages'])
+            for name, state in header['rng'].items():
+                game.rng.streams[name].bit_generator.state = state
+            replayed += 1
+    return replayed
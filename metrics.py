@@ -0,0 +1,151 @@
+"""
+Periodic export of game metrics to local files, for scraping long-running
+sessions and bot farms.
+
+Each export appends one JSON object to a JSONL file and rewrites a Prometheus
+textfile (as read by node_exporter's textfile collector). The game loop only
+takes a small snapshot; formatting and file I/O happen on a background thread.
+"""
+import argparse
+import json
+import os
+import queue
+import resource
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from timing import Timings
+
+# Phases recorded by Timings that are worth exporting.
+EXPORTED_PHASES = ['frame', 'latency', 'dispatch', 'maybe_move', 'ai', 'compute_fov', 'draw_map', 'flush', 'autosave']
+
+
+def rss_bytes() -> int:
+    """Current resident set size, falling back to the peak if unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes(who: int = resource.RUSAGE_SELF) -> int:
+    """Peak resident set size of this process (or of who)."""
+    peak = resource.getrusage(who).ru_maxrss
+    # macOS reports bytes, Linux reports kilobytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class MetricsExporter:
+
+    def __init__(
+            self,
+            jsonl_path: Optional[str] = None,
+            prom_path: Optional[str] = None,
+            interval: float = 10.0
+    ) -> None:
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.interval = interval  # seconds between exports
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='metrics', daemon=True)
+        self._thread.start()
+        self._last_time = time.monotonic()
+        self._last_turns = 0
+        self._turns_total = 0
+
+    def tick(self, game, force: bool = False) -> None:
+        """Call once per loop iteration; exports when the interval has passed, or if forced."""
+        self.tick_totals(game.turns, game.timings, force, mobs=len(game.mobs), messages=len(game.messages))
+
+    def tick_totals(
+            self,
+            turns: int,
+            timings: Timings,
+            force: bool = False,
+            **gauges: float
+    ) -> None:
+        """Like tick(), for turns and timings that aren't one game's, e.g. a bot farm's."""
+        now = time.monotonic()
+        if force or now - self._last_time >= self.interval:
+            self._queue.put(self.snapshot(turns, timings, gauges, now))
+
+    def snapshot(
+            self,
+            turns: int,
+            timings: Timings,
+            gauges: Dict[str, float],
+            now: float
+    ) -> Dict[str, Any]:
+        # A restart starts a new Game with its turn counter back at zero.
+        played = turns - self._last_turns if turns >= self._last_turns else turns
+        self._turns_total += played
+        elapsed = now - self._last_time
+        self._last_time = now
+        self._last_turns = turns
+        phases = {}
+        for phase in EXPORTED_PHASES:
+            if timings.samples.get(phase):
+                phases[phase] = timings.percentiles(phase)
+        return {
+            'time': time.time(),
+            'turns_total': self._turns_total,
+            'turns_per_second': played / elapsed if elapsed else 0.0,
+            'phases': phases,
+            **gauges,
+            'rss_bytes': rss_bytes(),
+        }
+
+    def close(self) -> None:
+        """Finish writing what has been exported and stop the writer."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            snapshot = self._queue.get()
+            if snapshot is None:
+                return
+            if self.jsonl_path:
+                with open(self.jsonl_path, 'a') as f:
+                    f.write(json.dumps(snapshot) + '\n')
+            if self.prom_path:
+                # Write then rename so scrapers never see a partial file.
+                tmp_path = self.prom_path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    f.write(format_prometheus(snapshot))
+                os.replace(tmp_path, self.prom_path)
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group('metrics export')
+    group.add_argument('--metrics-jsonl', metavar='PATH', help='append a JSON line of metrics here')
+    group.add_argument('--metrics-prom', metavar='PATH', help='keep a Prometheus textfile of metrics here')
+    group.add_argument('--metrics-interval', type=float, metavar='SECONDS', help='between exports (default 10)')
+
+
+def metrics_from_args(args: argparse.Namespace) -> Optional[MetricsExporter]:
+    """An exporter for the metrics flags, or None if no file was asked for."""
+    if not (args.metrics_jsonl or args.metrics_prom):
+        return None
+    return MetricsExporter(args.metrics_jsonl, args.metrics_prom, args.metrics_interval or 10.0)
+
+
+def format_prometheus(snapshot: Dict[str, Any]) -> str:
+    lines = [
+        '# TYPE pmrl_turns_total counter',
+        f'pmrl_turns_total {snapshot["turns_total"]}',
+        '# TYPE pmrl_turns_per_second gauge',
+        f'pmrl_turns_per_second {snapshot["turns_per_second"]:.3f}',
+        '# TYPE pmrl_phase_seconds summary',
+    ]
+    for phase, values in snapshot['phases'].items():
+        for quantile, value in zip(('0.5', '0.95', '0.99'), values):
+            lines.append(f'pmrl_phase_seconds{{phase="{phase}",quantile="{quantile}"}} {value:.6f}')
+    for name, value in snapshot.items():
+        if name not in ('time', 'turns_total', 'turns_per_second', 'phases'):
+            lines.extend([f'# TYPE pmrl_{name} gauge', f'pmrl_{name} {value}'])
+    return '\n'.join(lines) + '\n'
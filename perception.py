@@ -0,0 +1,96 @@
+"""
+Which mobs can see the player, answered for all of them at once.
+
+Within the player's FOV window sight is taken to be mutual: a mob sees the
+player exactly when the player sees it, so the answer is a lookup and mobs
+never spot the player from somewhere the player can't see. Mobs that see
+farther than the player are checked beyond the window by marching lines of
+sight for all of them together, one numpy array per step along the lines.
+
+Answers are cached until the turn, the level, the player's position or the
+tiles change, so asking again within a turn is free.
+"""
+from typing import Optional, Set, Tuple
+
+import numpy as np
+
+from fov import field_of_view
+import travel
+
+
+def line_of_sight(transparent: np.ndarray, sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """
+    Whether each source can see its target, given a transparency array
+    indexed [y, x] and (n, 2) arrays of x, y. Only the tiles between the
+    two have to be transparent. Each line is drawn from the endpoint with the
+    smaller x, y, so a can see b exactly when b can see a.
+    """
+    sources = np.asarray(sources, dtype=np.int64).reshape(-1, 2)
+    targets = np.asarray(targets, dtype=np.int64).reshape(-1, 2)
+    if not len(sources):
+        return np.ones(0, dtype=bool)
+    swap = (targets[:, 0] < sources[:, 0]) | (
+        (targets[:, 0] == sources[:, 0]) & (targets[:, 1] < sources[:, 1])
+    )
+    start = np.where(swap[:, None], targets, sources)
+    delta = np.where(swap[:, None], sources, targets) - start
+    steps = np.abs(delta).max(axis=1)
+    visible = np.ones(len(sources), dtype=bool)
+    # Bresenham: one tile per step along the longer axis, the other axis
+    # rounded. All lines take their step at once, and drop out once they
+    # are blocked or have reached their end.
+    marching = np.arange(len(sources))
+    t = 1
+    while True:
+        marching = marching[steps[marching] > t]
+        if not len(marching):
+            return visible
+        n = steps[marching]
+        xs = start[marching, 0] + (2 * t * delta[marching, 0] + n) // (2 * n)
+        ys = start[marching, 1] + (2 * t * delta[marching, 1] + n) // (2 * n)
+        blocked = ~transparent[ys, xs]
+        visible[marching[blocked]] = False
+        marching = marching[~blocked]
+        t += 1
+
+
+class Perception:
+
+    def __init__(self) -> None:
+        self.key: Optional[Tuple[int, int, int, int, int]] = None
+        self._watchers: Set[Tuple[int, int]] = set()
+
+    def watchers(self, game) -> Set[Tuple[int, int]]:
+        """Coordinates of the mobs that can see the player, if mobs can see."""
+        sight = game.config.mob_sight
+        if sight is None:
+            return set()
+        key = game.level, game.turns, game.player_x, game.player_y, game.tile_changes.version
+        if key != self.key:
+            self.key = key
+            self._watchers = self._look(game, sight)
+        return self._watchers
+
+    def _look(self, game, sight: int) -> Set[Tuple[int, int]]:
+        mobs = travel.mobs_near(game, sight)
+        if not mobs:
+            return set()
+        fov = game.fov
+        if fov.pov != (game.player_x, game.player_y) or fov.version != game.tile_changes.version:
+            # The player moved, or a door opened, this turn and the FOV
+            # hasn't caught up yet.
+            fov = field_of_view(game.fov_map.transparent, game.player_x, game.player_y, game.config.fov_radius)
+        radius = game.config.fov_radius
+        coords = np.array(mobs, dtype=np.int64)
+        distance = np.abs(coords - (game.player_x, game.player_y)).max(axis=1)
+        seen = set()
+        # Everything within the FOV radius of the player is in their window.
+        for x, y in coords[distance <= radius].tolist():
+            if (x, y) in fov:
+                seen.add((x, y))
+        far = coords[distance > radius]
+        if len(far):
+            player = np.broadcast_to((game.player_x, game.player_y), far.shape)
+            visible = line_of_sight(game.fov_map.transparent, far, player)
+            seen.update(map(tuple, far[visible].tolist()))
+        return seen
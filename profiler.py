@@ -0,0 +1,135 @@
+"""
+Profile a live session for a number of turns, started from a hotkey or the
+command line, without restarting the game.
+
+Two profilers can run together. cProfile gives exact call counts and times,
+written as a pstats file. The sampler takes the interrupted stack on SIGPROF
+(every interval seconds of CPU time) and writes collapsed stacks, one
+'outer;inner count' line per stack, for flamegraph.pl or speedscope.
+
+Nothing is installed until a profile starts: no trace hook, no signal
+handler, no timer. Both are removed again when the turns run out.
+"""
+from collections import Counter
+from contextlib import contextmanager
+import cProfile
+import os
+import signal
+import time
+from typing import Iterator, List, Optional
+
+MODES = ('cprofile', 'sampling', 'both')
+
+
+class Profiler:
+
+    def __init__(
+            self,
+            directory: str = 'profiles',
+            turns: int = 100,
+            mode: str = 'both',
+            interval: float = 0.001
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(f'Unknown profiler mode {mode!r}')
+        self.directory = directory
+        self.turns = turns  # how many turns each profile covers
+        self.mode = mode
+        self.interval = interval  # seconds of CPU time between samples
+        self.active = False
+        self.dry = False  # counting turns without profiling, see start()
+        self.stop_turn = 0
+        self.name = ''
+        self.profile: Optional[cProfile.Profile] = None
+        self.stacks: Counter = Counter()
+        self._previous_handler = None
+
+    @property
+    def sampling(self) -> bool:
+        return self.mode != 'cprofile' and hasattr(signal, 'setitimer')
+
+    def start(self, turn: int, dry: bool = False) -> None:
+        """
+        Profile from now until turn + self.turns. A dry run only counts the
+        turns, and stops with the files it would have written, so replaying
+        a session that was profiled neither profiles nor writes anything.
+        """
+        if self.active:
+            return
+        self.active = True
+        self.dry = dry
+        self.stop_turn = turn + self.turns
+        self.name = f'{time.strftime("%Y%m%d-%H%M%S")}-turn{turn}'
+        if dry:
+            return
+        if self.mode != 'sampling':
+            self.profile = cProfile.Profile()
+            try:
+                self.profile.enable()
+            except ValueError:
+                # Another profiler (e.g. cli.py --profile) owns the hook.
+                self.profile = None
+        if self.sampling:
+            self.stacks.clear()
+            self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self) -> List[str]:
+        """Stop profiling and write the results. Returns the files written."""
+        if not self.active:
+            return []
+        self.active = False
+        base = os.path.join(self.directory, self.name)
+        if self.dry:
+            self.dry = False
+            paths = []
+            if self.mode != 'sampling':
+                paths.append(base + '.pstats')
+            if self.sampling:
+                paths.append(base + '.collapsed')
+            return paths
+        os.makedirs(self.directory, exist_ok=True)
+        paths = []
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(base + '.pstats')
+            self.profile = None
+            paths.append(base + '.pstats')
+        if self.sampling:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+            with open(base + '.collapsed', 'w') as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f'{stack} {count}\n')
+            paths.append(base + '.collapsed')
+        return paths
+
+    def tick(self, turn: int) -> List[str]:
+        """Call after each frame; stops once enough turns have been profiled."""
+        if turn >= self.stop_turn:
+            return self.stop()
+        return []
+
+    @contextmanager
+    def paused(self) -> Iterator[None]:
+        """
+        Leave time spent idle, e.g. waiting for input, out of the cProfile
+        results. The sampler counts CPU time, so it already skips idling.
+        """
+        if self.profile is None:
+            yield
+            return
+        self.profile.disable()
+        try:
+            yield
+        finally:
+            if self.profile is not None:
+                self.profile.enable()
+
+    def _sample(self, signum, frame) -> None:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(names))] += 1
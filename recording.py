@@ -0,0 +1,106 @@
+"""
+Compact binary input logs: a game's seed and configuration followed by every
+input event that was dispatched to a state handler, and finally a hash of the
+end state.
+
+Layout (little endian):
+
+    header  b'PMRL', version (u8), seed length (u8), seed (unsigned),
+            config length (u32), config (JSON of GameConfig fields)
+    key     1 (u8), scancode (u16), modifiers (u16)
+    click   2 (u8), tile x (u16), tile y (u16), button (u8)
+    quit    3 (u8)
+    end     0 (u8), sha256 of the final state (32 bytes)
+"""
+import json
+import struct
+from typing import BinaryIO, List, Optional, Tuple
+
+import tcod
+import tcod.event
+
+from config import GameConfig
+
+MAGIC = b'PMRL'
+VERSION = 3
+# Logs from before the configuration was recorded can still be replayed,
+# given the configuration separately.
+VERSIONS = (2, VERSION)
+
+END = 0
+KEY = 1
+CLICK = 2
+QUIT = 3
+
+KEY_RECORD = struct.Struct('<HH')
+CLICK_RECORD = struct.Struct('<HHB')
+CONFIG_LENGTH = struct.Struct('<I')
+DIGEST_SIZE = 32
+
+
+class Recorder:
+
+    def __init__(self, path: str, seed: int, config: GameConfig) -> None:
+        self.file: BinaryIO = open(path, 'wb')
+        seed_bytes = seed.to_bytes(max(1, (seed.bit_length() + 7) // 8), 'little')
+        config_bytes = json.dumps(config.to_dict()).encode()
+        self.file.write(
+            MAGIC + bytes([VERSION, len(seed_bytes)]) + seed_bytes
+            + CONFIG_LENGTH.pack(len(config_bytes)) + config_bytes
+        )
+
+    def record(self, event: tcod.event.Event) -> None:
+        if isinstance(event, tcod.event.KeyDown):
+            self.file.write(bytes([KEY]) + KEY_RECORD.pack(event.scancode, event.mod))
+        elif isinstance(event, tcod.event.MouseButtonDown):
+            x, y = event.tile
+            self.file.write(bytes([CLICK]) + CLICK_RECORD.pack(x, y, event.button))
+        elif isinstance(event, tcod.event.Quit):
+            self.file.write(bytes([QUIT]))
+
+    def close(self, digest: bytes) -> None:
+        self.file.write(bytes([END]) + digest)
+        self.file.close()
+
+
+def read_log(path: str) -> Tuple[int, Optional[GameConfig], List[tcod.event.Event], Optional[bytes]]:
+    """
+    Return the seed, the configuration (None for logs from before it was
+    recorded), the events and the final state hash, if recorded.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != MAGIC:
+        raise ValueError(f'{path} is not an input log')
+    if data[4] not in VERSIONS:
+        raise ValueError(f'Unsupported input log version {data[4]}')
+    seed_end = 6 + data[5]
+    seed = int.from_bytes(data[6:seed_end], 'little')
+    i = seed_end
+    config = None
+    if data[4] >= 3:
+        (length,) = CONFIG_LENGTH.unpack_from(data, i)
+        i += CONFIG_LENGTH.size
+        config = GameConfig(**json.loads(data[i:i + length]))
+        i += length
+    events: List[tcod.event.Event] = []
+    digest = None
+    while i < len(data):
+        kind = data[i]
+        i += 1
+        if kind == KEY:
+            scancode, mod = KEY_RECORD.unpack_from(data, i)
+            i += KEY_RECORD.size
+            events.append(tcod.event.KeyDown(scancode=scancode, sym=0, mod=mod))
+        elif kind == CLICK:
+            x, y, button = CLICK_RECORD.unpack_from(data, i)
+            i += CLICK_RECORD.size
+            events.append(tcod.event.MouseButtonDown(tile=tcod.event.Point(x, y), button=button))
+        elif kind == QUIT:
+            events.append(tcod.event.Quit())
+        elif kind == END:
+            digest = data[i:i + DIGEST_SIZE]
+            break
+        else:
+            raise ValueError(f'Corrupt input log: unknown record type {kind}')
+    return seed, config, events, digest
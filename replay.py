@@ -0,0 +1,96 @@
+"""
+Record a session's input, or replay a recording headlessly as fast as
+possible and check that it ends in the same state.
+
+    python replay.py record session.pmrl [--seed N] [--map-size WxH ...]
+    python replay.py play session.pmrl
+
+A recording keeps the game's configuration, so it replays the same way
+whatever the flags.
+"""
+import argparse
+import sys
+from time import perf_counter
+from typing import Optional, Tuple
+
+import tcod
+
+from config import GameConfig, add_config_arguments, config_from_args
+from fsm import (
+    CONSOLE_HEIGHT,
+    CONSOLE_WIDTH,
+    STATE_HANDLERS,
+    Game,
+    HeadlessBackend,
+    State,
+    build_game,
+    game_hash,
+    open_window,
+    run_fsm,
+)
+from recording import Recorder, read_log
+
+
+def replay(path: str, config: Optional[GameConfig] = None) -> Tuple[Game, Optional[bytes]]:
+    """
+    Re-run a log through the state machine headlessly, one event per input
+    batch. Returns the final game and the hash the log ended with. The game
+    is configured as it was when recorded; config is only used for logs from
+    before the configuration was recorded.
+    """
+    seed, recorded_config, events, expected_hash = read_log(path)
+    if recorded_config is not None:
+        config = recorded_config
+    console = tcod.console.Console(CONSOLE_WIDTH, CONSOLE_HEIGHT, order='F')
+    backend = HeadlessBackend([event] for event in events)
+    game = build_game(console, console, backend=backend, seed=seed, config=config)
+    machine = run_fsm(STATE_HANDLERS, State.MAP, game)
+    return machine.game, expected_hash
+
+
+def record(path: str, seed: Optional[int], config: Optional[GameConfig] = None) -> None:
+    with open_window() as root_console:
+        draw_console = tcod.console.Console(CONSOLE_WIDTH, CONSOLE_HEIGHT, order='F')
+        game = build_game(root_console, draw_console, seed=seed, config=config)
+        game.recorder = Recorder(path, game.rng.seed, game.config)
+        machine = run_fsm(STATE_HANDLERS, State.MAP, game)
+        game.recorder.close(game_hash(machine.game))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    record_parser = subparsers.add_parser('record', help='play and record a session')
+    record_parser.add_argument('log')
+    record_parser.add_argument('--seed', type=int)
+    add_config_arguments(record_parser)
+    play_parser = subparsers.add_parser('play', help='replay a recorded session headlessly')
+    play_parser.add_argument('log')
+    args = parser.parse_args()
+    if args.command == 'record':
+        record(args.log, args.seed, config_from_args(args, record_parser))
+        return
+    if not play(args.log):
+        sys.exit(1)
+
+
+def play(path: str, config: Optional[GameConfig] = None) -> bool:
+    """Replay a log and report on it. Returns False if the end state differs."""
+    started = perf_counter()
+    game, expected_hash = replay(path, config)
+    elapsed = perf_counter() - started
+    actual_hash = game_hash(game)
+    print(f'{game.turns} turns in {elapsed:.3f}s ({game.turns / elapsed:.0f} turns/s)')
+    print(f'final state {actual_hash.hex()}')
+    if expected_hash is None:
+        print('log has no final state hash (was the session cut short?)')
+    elif expected_hash != actual_hash:
+        print(f'MISMATCH: recorded {expected_hash.hex()}')
+        return False
+    else:
+        print('final state matches the recording')
+    return True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Seeded random number streams, one per subsystem.
+
+Every stream is derived from a single seed, so a game can be reproduced from
+its seed, and subsystems don't perturb each other: e.g. adding a combat roll
+doesn't change the map that a seed generates.
+"""
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+STREAMS = ('mapgen', 'spawns', 'ai', 'combat', 'meta')
+
+
+class RngService:
+
+    def __init__(self, seed: Optional[int] = None) -> None:
+        seed_sequence = np.random.SeedSequence(seed)
+        # Keep the seed that was actually used, even if none was given.
+        self.seed: int = seed_sequence.entropy
+        self.streams: Dict[str, np.random.Generator] = {
+            name: np.random.Generator(np.random.PCG64(child))
+            for name, child in zip(STREAMS, seed_sequence.spawn(len(STREAMS)))
+        }
+
+    def __getattr__(self, name: str) -> np.random.Generator:
+        # rng.mapgen, rng.ai, etc.
+        try:
+            return self.__dict__['streams'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def next_seed(self) -> int:
+        """A seed for the next game, so a whole session follows from one seed."""
+        return int(self.streams['meta'].integers(2 ** 63))
+
+    def get_state(self) -> Dict[str, Any]:
+        """JSON-serializable state of every stream, e.g. for save games."""
+        return {
+            'seed': self.seed,
+            'streams': {
+                name: stream.bit_generator.state
+                for name, stream in self.streams.items()
+            },
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> 'RngService':
+        rng = cls(state['seed'])
+        for name, stream_state in state['streams'].items():
+            rng.streams[name].bit_generator.state = stream_state
+        return rng
@@ -0,0 +1,196 @@
+"""
+Save games: the full state of play in a compact, versioned binary file.
+
+Layout:
+
+    prefix  b'PMSV', version (u8), header length (u32, little endian)
+    header  JSON: player, exit, level, turns, messages, RNG state and config
+    arrays  an uncompressed .npz: tile codes, the memory mask packed 8 tiles
+            to a byte, and the mobs' coordinates and hit points in turn order;
+            then the same for every other level visited, prefixed levelN_,
+            with their stairs (exit x, y, entrance x, y, -1 for none)
+
+Loading is a handful of array reads, not a regeneration of the level. Levels
+that were never visited are generated afresh when the player gets to them.
+A Dungeon spills levels to disk in the same arrays.
+"""
+from concurrent.futures import Future
+from itertools import chain
+import json
+import os
+import struct
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from bitmemory import BitMemory
+
+MAGIC = b'PMSV'
+VERSION = 2
+VERSIONS = (1, VERSION)  # version 1 saves hold only the current level
+PREFIX = struct.Struct('<4sBI')
+
+# Where S saves in game; resume with python cli.py --load savegame.pmsv
+SAVE_PATH = 'savegame.pmsv'
+
+# The header and arrays making up a save, copied out of a game. In a fresh
+# snapshot the mob coordinates and hit points are still plain lists.
+Snapshot = Tuple[Dict[str, Any], Dict[str, Any]]
+
+
+def pack_memory(memory: BitMemory) -> np.ndarray:
+    """Memory as one bit array, as before it was chunked."""
+    return np.packbits(memory.to_array())
+
+
+def unpack_memory(packed: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    height, width = shape
+    return np.unpackbits(packed, count=height * width).reshape(height, width).view(bool)
+
+
+def pack_mobs(mob_coords: Iterable[Tuple[int, int]], mob_hp: List[int]) -> Dict[str, np.ndarray]:
+    """Mob coordinates and hit points, in turn order, as arrays."""
+    coords = chain.from_iterable(mob_coords)
+    return {
+        'mob_coords': np.fromiter(coords, dtype=np.int32, count=2 * len(mob_hp)).reshape(-1, 2),
+        'mob_hp': np.array(mob_hp, dtype=np.int32),
+    }
+
+
+def level_contents(level) -> Dict[str, Any]:
+    """
+    What a save needs of a dungeon.Level that isn't being played. The mobs'
+    coordinates and hit points are copied out; the arrays are not.
+    """
+    return dict(
+        tile_codes=level.tile_codes,
+        memory=level.memory,
+        stairs=np.array([
+            level.exit_x,
+            level.exit_y,
+            -1 if level.entrance_x is None else level.entrance_x,
+            -1 if level.entrance_y is None else level.entrance_y,
+        ], dtype=np.int32),
+        mob_coords=list(level.mobs),
+        mob_hp=[mob.hp for mob in level.mobs.values()],
+    )
+
+
+def pack_contents(contents: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """The arrays of a level's contents, as saved and spilled."""
+    return dict(
+        tile_codes=contents['tile_codes'],
+        memory=pack_memory(contents['memory']),
+        stairs=contents['stairs'],
+        **pack_mobs(contents['mob_coords'], contents['mob_hp'])
+    )
+
+
+def pack_level(level) -> Dict[str, np.ndarray]:
+    """The arrays of a dungeon.Level that isn't being played."""
+    return pack_contents(level_contents(level))
+
+
+def snapshot(game) -> Snapshot:
+    """
+    Copy out everything a save needs, so the game can go on changing while
+    it is written. Only copies; packing and conversion to arrays are left
+    to write_save(). Other levels that were visited are copied the same way,
+    or, if they were spilled to disk, read back on the dungeon's thread.
+    """
+    mobs = game.mobs
+    header = {
+        'player_x': game.player_x,
+        'player_y': game.player_y,
+        'player_hp': game.player_hp,
+        'exit_x': game.exit_x,
+        'exit_y': game.exit_y,
+        'turns': game.turns,
+        'won': game.won,
+        'level': game.level,
+        'entrance_x': game.entrance_x,
+        'entrance_y': game.entrance_y,
+        'messages': list(game.messages),
+        'rng': game.rng.get_state(),
+        'config': game.config.to_dict(),
+    }
+    arrays = {
+        'tile_codes': game.tile_codes.copy(),
+        'memory': game.memory.copy(),  # shares the chunks, which are never changed
+        'mob_coords': list(mobs),
+        'mob_hp': [mob.hp for mob in mobs.values()],
+        'levels': {},
+    }
+    if game.dungeon is not None:
+        for number, level in game.dungeon.visited(game.level).items():
+            if not isinstance(level, Future):
+                # Copied now, as the player may come back and change it
+                # before the save is written.
+                level = level_contents(level)
+                level.update(tile_codes=level['tile_codes'].copy(), memory=level['memory'].copy())
+            arrays['levels'][number] = level
+    return header, arrays
+
+
+def write_save(path: str, save: Snapshot, sync: bool = True) -> None:
+    """
+    Write a snapshot. The file is written beside path and renamed into place,
+    so a crash never leaves a half-written save. With sync, it is also on
+    disk, rename included, when this returns.
+    """
+    header, arrays = save
+    levels = arrays['levels']
+    arrays = dict(
+        tile_codes=arrays['tile_codes'],
+        memory=pack_memory(arrays['memory']),
+        **pack_mobs(arrays['mob_coords'], arrays['mob_hp'])
+    )
+    for number, level in sorted(levels.items()):
+        # Spilled levels are read back on the dungeon's thread.
+        level_arrays = level.result() if isinstance(level, Future) else pack_contents(level)
+        for name, array in level_arrays.items():
+            arrays[f'level{number}_{name}'] = array
+    header_bytes = json.dumps(header).encode()
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        np.savez(f, **arrays)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if sync and hasattr(os, 'O_DIRECTORY'):
+        directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+def save_game(game, path: str) -> None:
+    write_save(path, snapshot(game))
+
+
+def read_save(path: str) -> Snapshot:
+    """
+    Return the header and arrays of a save, with the memory unpacked. The
+    other levels' arrays are under 'levels', by number, still packed.
+    """
+    with open(path, 'rb') as f:
+        magic, version, header_length = PREFIX.unpack(f.read(PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a save game')
+        if version not in VERSIONS:
+            raise ValueError(f'Unsupported save game version {version}')
+        header = json.loads(f.read(header_length))
+        with np.load(f) as npz:
+            arrays: Dict[str, Any] = {'levels': {}}
+            for name in npz.files:
+                if name.startswith('level'):
+                    number, level_name = name[len('level'):].split('_', 1)
+                    arrays['levels'].setdefault(int(number), {})[level_name] = npz[name]
+                else:
+                    arrays[name] = npz[name]
+    arrays['memory'] = unpack_memory(arrays['memory'], arrays['tile_codes'].shape)
+    return header, arrays
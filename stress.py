@@ -0,0 +1,109 @@
+"""
+Stress test the FSM game at scale: build a big configured game, have a bot
+play it headlessly, and report build time, memory and per-turn latency.
+
+    python stress.py --map-size 2000x2000 --mobs 100000 --walk-length 2000000
+"""
+import argparse
+import json
+from time import perf_counter
+from typing import Any, Dict
+
+import numpy as np
+import tcod
+
+from bots import POLICIES
+from config import GameConfig, add_config_arguments, config_from_args
+from fsm import (
+    CONSOLE_HEIGHT,
+    CONSOLE_WIDTH,
+    HeadlessBackend,
+    MapStateHandler,
+    State,
+    build_game,
+    draw_map,
+)
+from metrics import peak_rss_bytes, rss_bytes
+from timing import Timings
+
+# Without a radius every mob on a huge map acts every turn.
+DEFAULT_AI_RADIUS = 64
+
+
+def array_bytes(game) -> Dict[str, int]:
+    return {
+        'tile_codes': game.tile_codes.nbytes,
+        'memory': game.memory.nbytes,
+        'fov_map': game.fov_map.transparent.nbytes * 3,  # transparent, walkable, fov
+    }
+
+
+def stress(config: GameConfig, turns: int, policy_name: str, seed: int) -> Dict[str, Any]:
+    console = tcod.console.Console(CONSOLE_WIDTH, CONSOLE_HEIGHT, order='F')
+    timings = Timings(window=turns)
+    timings.collect()
+    rss_before = rss_bytes()
+    started = perf_counter()
+    game = build_game(
+        console,
+        console,
+        backend=HeadlessBackend(),
+        timings=timings,
+        seed=seed,
+        config=config
+    )
+    build_seconds = perf_counter() - started
+    rss_after = rss_bytes()
+    handler = MapStateHandler(State.MAP, game)
+    policy = POLICIES[policy_name](game, np.random.default_rng(seed))
+    latencies = []
+    while handler.next_state == State.MAP and len(latencies) < turns:
+        started = perf_counter()
+        handler.maybe_move(*policy.choose())
+        draw_map(game)
+        latencies.append(perf_counter() - started)
+    p50, p95, p99 = (float(ms) for ms in np.percentile(latencies or [0], [50, 95, 99]) * 1000)
+    return {
+        'config': config.to_dict(),
+        'mobs': len(game.mobs),
+        'build_seconds': build_seconds,
+        'rss_delta_bytes': rss_after - rss_before,
+        'peak_rss_bytes': peak_rss_bytes(),
+        'array_bytes': array_bytes(game),
+        'turns': len(latencies),
+        'turn_ms': {'p50': p50, 'p95': p95, 'p99': p99},
+        'phase_ms': {
+            phase: [seconds * 1000 for seconds in timings.percentiles(phase)]
+            for phase in timings.samples
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play a large configured game headlessly.')
+    add_config_arguments(parser)
+    parser.add_argument('--turns', type=int, default=200)
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='random')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+    config = config_from_args(args, parser)
+    if config.ai_radius is None:
+        config.ai_radius = DEFAULT_AI_RADIUS
+    report = stress(config, args.turns, args.policy, args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f'{config.map_width}x{config.map_height} map, {report["mobs"]} mobs, '
+          f'built in {report["build_seconds"]:.2f}s')
+    print(f'RSS +{report["rss_delta_bytes"] / 2 ** 20:.1f} MiB, '
+          f'peak {report["peak_rss_bytes"] / 2 ** 20:.1f} MiB')
+    for name, size in report['array_bytes'].items():
+        print(f'  {name:<12} {size / 2 ** 20:9.1f} MiB')
+    latency = report['turn_ms']
+    print(f'{report["turns"]} turns: p50 {latency["p50"]:.2f} ms  '
+          f'p95 {latency["p95"]:.2f} ms  p99 {latency["p99"]:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Tiles that change during play: doors opening and closing, walls dug through.
+
+What can be walked on and seen through is derived from the tile codes, into
+the fov_map's walkable and transparent arrays, and more is derived from
+those: the FOV, the auto-explorer's distance map, which mobs can see the
+player. Rather than rebuild any of it, set_tile() updates the arrays for the
+one tile and logs the box that changed under a new version. Everything
+derived from the tiles remembers the version it is up to date with and asks
+the log what changed since, so catching up costs as much as the change
+does. Only something that has fallen so far behind that the log has been
+trimmed has to rebuild.
+"""
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+import numpy as np
+
+# Tile codes
+FLOOR = ord('.')
+WALL = ord('#')
+DOOR = ord('+')  # closed
+OPEN_DOOR = ord("'")
+
+WALKABLE = np.zeros(256, dtype=bool)
+WALKABLE[[FLOOR, OPEN_DOOR]] = True
+TRANSPARENT = WALKABLE.copy()
+
+Box = Tuple[int, int, int, int]  # x, y, width, height
+
+
+class Changes:
+    """A versioned log of the boxes of the map whose tiles changed."""
+
+    def __init__(self, keep: int = 1000) -> None:
+        self.version = 0  # bumped by every change
+        self._log: Deque[Tuple[int, Box]] = deque(maxlen=keep)
+
+    def mark(self, x: int, y: int, width: int, height: int) -> None:
+        self.version += 1
+        self._log.append((self.version, (x, y, width, height)))
+
+    def mark_all(self) -> None:
+        """Everything changed, e.g. for a new level, so what's derived must be rebuilt."""
+        self.version += 1
+        self._log.clear()
+
+    def since(self, version: int) -> Optional[List[Box]]:
+        """The boxes changed after version, or None if the log no longer goes back that far."""
+        if version == self.version:
+            return []
+        if not self._log or self._log[0][0] > version + 1:
+            return None
+        return [box for changed, box in self._log if changed > version]
+
+
+def derive(tile_codes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """The walkable and transparent arrays for tile codes."""
+    return WALKABLE[tile_codes], TRANSPARENT[tile_codes]
+
+
+def set_tile(game, x: int, y: int, code: int) -> None:
+    game.tile_codes[y, x] = code
+    refresh(game, x, y, 1, 1)
+
+
+def refresh(game, x: int, y: int, width: int, height: int) -> None:
+    """Bring what's derived from the tiles in a box up to date with them."""
+    box = np.s_[y:y + height, x:x + width]
+    game.fov_map.walkable[box], game.fov_map.transparent[box] = derive(game.tile_codes[box])
+    game.tile_changes.mark(x, y, width, height)
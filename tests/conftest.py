@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+import tcod
+
+# The game's modules live at the top of the repository, not in a package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fsm  # noqa: E402
+
+
+@pytest.fixture
+def console() -> tcod.console.Console:
+    return tcod.console.Console(fsm.CONSOLE_WIDTH, fsm.CONSOLE_HEIGHT, order='F')
@@ -0,0 +1,78 @@
+"""
+The explorer keeps its distance map up to date incrementally; after every
+update it must match one built from scratch.
+"""
+import numpy as np
+import pytest
+
+import autoexplore
+import fsm
+import terrain
+from config import GameConfig
+
+
+def assert_same(explorer: autoexplore.Explorer, fresh: autoexplore.Explorer) -> None:
+    assert np.array_equal(explorer.floor, fresh.floor)
+    assert np.array_equal(explorer.frontier, fresh.frontier)
+    assert np.array_equal(explorer.distance, fresh.distance)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_update_while_exploring(console, seed):
+    game = fsm.build_game(console, console, seed=seed, config=GameConfig(map_width=120, map_height=60))
+    handler = fsm.MapStateHandler(fsm.State.MAP, game)
+    explorer = autoexplore.Explorer(game)
+    for _ in range(200):
+        step = explorer.downhill()
+        if step is None or handler.next_state != fsm.State.MAP:
+            break
+        handler.maybe_move(*step)
+        explorer.update()
+        assert_same(explorer, autoexplore.Explorer(game))
+    assert game.turns > 0
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_update_after_terrain_edits(console, seed):
+    config = GameConfig(map_width=120, map_height=60, doors=15)
+    game = fsm.build_game(console, console, seed=seed, config=config)
+    handler = fsm.MapStateHandler(fsm.State.MAP, game)
+    explorer = autoexplore.Explorer(game)
+    rng = np.random.default_rng(seed)
+    codes = [terrain.FLOOR, terrain.WALL, terrain.DOOR, terrain.OPEN_DOOR]
+    for _ in range(150):
+        step = explorer.downhill()
+        if step is None or handler.next_state != fsm.State.MAP:
+            break
+        handler.maybe_move(*step)
+        # Edits near the player, some in view and some in what's remembered.
+        for _ in range(rng.integers(0, 3)):
+            x = int(np.clip(game.player_x + rng.integers(-6, 7), 0, game.map_width - 1))
+            y = int(np.clip(game.player_y + rng.integers(-6, 7), 0, game.map_height - 1))
+            if (x, y) not in game.occupied_coords:
+                terrain.set_tile(game, x, y, int(rng.choice(codes)))
+        explorer.update()
+        assert_same(explorer, autoexplore.Explorer(game))
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_update_after_digging_and_closing(console, seed):
+    game = fsm.build_game(console, console, seed=seed, config=GameConfig(doors=15))
+    handler = fsm.MapStateHandler(fsm.State.MAP, game)
+    explorer = autoexplore.Explorer(game)
+    rng = np.random.default_rng(seed)
+    directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+    for _ in range(200):
+        if handler.next_state != fsm.State.MAP:
+            break
+        direction = directions[rng.integers(len(directions))]
+        roll = rng.random()
+        if roll < 0.15:
+            handler.maybe_move(*direction, 'dig')
+        elif roll < 0.25:
+            handler.maybe_move(*direction, 'close')
+        else:
+            explorer.update()
+            handler.maybe_move(*(explorer.downhill() or direction))
+        explorer.update()
+        assert_same(explorer, autoexplore.Explorer(game))
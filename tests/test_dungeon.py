@@ -0,0 +1,60 @@
+"""
+Going between the levels of a dungeon.
+"""
+import pytest
+
+import fsm
+from config import GameConfig
+from dungeon import Dungeon
+import savegame
+
+
+def occupied(game) -> set:
+    return set(game.mobs) | {(game.player_x, game.player_y), (game.exit_x, game.exit_y)}
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_mobs_next_to_the_exit_after_going_back_down(console, seed):
+    game = fsm.build_game(console, console, seed=seed, config=GameConfig(levels=2))
+    handler = fsm.MapStateHandler(fsm.State.MAP, game)
+    handler.change_level(1)
+    handler.change_level(0)
+    exit_coords = game.exit_x, game.exit_y
+    assert (game.player_x, game.player_y) == exit_coords
+    # Crowd the exit with mobs that would wander onto it.
+    for dx, dy in fsm.MOB_MOVES[1:]:
+        x, y = game.exit_x + dx, game.exit_y + dy
+        if fsm.is_walkable(x, y, game.fov_map.walkable) and (x, y) not in game.occupied_coords:
+            game.mobs[x, y] = fsm.Mob(hp=3)
+            game.occupied_coords.add((x, y))
+    for _ in range(3):
+        handler.wait()
+        assert exit_coords not in game.mobs
+    # Step off, and let them onto it and off it again.
+    for dx, dy in fsm.MOB_MOVES[1:]:
+        if handler.check_move(game.player_x, game.player_y, dx, dy)[1] == 'move':
+            handler.maybe_move(dx, dy)
+            break
+    for _ in range(50):
+        handler.wait()
+        assert game.occupied_coords == occupied(game)
+
+
+def test_save_keeps_other_levels_as_they_were(console, tmp_path):
+    game = fsm.build_game(console, console, seed=3, config=GameConfig(levels=2), dungeon=Dungeon(3))
+    handler = fsm.MapStateHandler(fsm.State.MAP, game)
+    handler.change_level(1)
+    save = savegame.snapshot(game)
+    # Fight on the level below before the save is written.
+    below = game.dungeon.visited(game.level)[0]
+    hp = {coords: mob.hp for coords, mob in below.mobs.items()}
+    for mob in below.mobs.values():
+        mob.hp -= 1
+    path = str(tmp_path / 'save.pmsv')
+    savegame.write_save(path, save)
+    game.dungeon.close()
+    loaded = fsm.load_game(path, console, console, dungeon=Dungeon(3))
+    loaded.player_x, loaded.player_y = loaded.entrance_x, loaded.entrance_y
+    fsm.take_stairs(loaded, 0)
+    assert {coords: mob.hp for coords, mob in loaded.mobs.items()} == hp
+    loaded.dungeon.close()
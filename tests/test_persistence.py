@@ -0,0 +1,110 @@
+"""
+Games brought back from disk must be exactly the games that were left.
+"""
+import numpy as np
+import pytest
+
+import fsm
+from bots import RandomPolicy
+from config import GameConfig
+from history import History
+from journal import Journal
+
+
+def play(game, turns: int, seed: int) -> fsm.MapStateHandler:
+    handler = fsm.MapStateHandler(fsm.State.MAP, game)
+    policy = RandomPolicy(game, np.random.default_rng(seed))
+    while game.turns < turns and handler.next_state == fsm.State.MAP:
+        handler.maybe_move(*policy.choose())
+    return handler
+
+
+@pytest.mark.parametrize('compact_every', [1000, 50])
+@pytest.mark.parametrize('seed', range(3))
+def test_recover_journal(console, tmp_path, seed, compact_every):
+    journal = Journal(str(tmp_path), compact_every=compact_every)
+    config = GameConfig(mobs=60, player_hp=1000, doors=10)
+    game = fsm.build_game(console, console, seed=seed, config=config, journal=journal)
+    play(game, 200, seed)
+    journal.close()
+    recovered = fsm.recover_game(str(tmp_path), console, console)
+    assert recovered.turns == game.turns
+    assert fsm.game_hash(recovered) == fsm.game_hash(game)
+    assert recovered.rng.get_state() == game.rng.get_state()
+
+
+def state(game):
+    # The order of the mobs is the order they take their turns in.
+    return fsm.game_hash(game), game.rng.get_state(), list(game.mobs)
+
+
+def play_rewindable(game, turns: int, seed: int):
+    """Play with a history, returning the moves tried and the state before each turn."""
+    handler = fsm.MapStateHandler(fsm.State.MAP, game)
+    policy = RandomPolicy(game, np.random.default_rng(seed))
+    moves = []
+    before = {}  # turns -> (the move that took the next one, the state before it)
+    while game.turns < turns and handler.next_state == fsm.State.MAP:
+        turn, previous = game.turns, state(game)
+        moves.append(policy.choose())
+        handler.maybe_move(*moves[-1])
+        if game.turns != turn:
+            before[turn] = len(moves) - 1, previous
+    return handler, moves, before
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_rewind(console, seed):
+    config = GameConfig(mobs=60, player_hp=1000, doors=10)
+    game = fsm.build_game(console, console, seed=seed, config=config, history=History(150))
+    handler, moves, before = play_rewindable(game, 200, seed)
+    final = state(game)
+    assert len(game.history) == min(game.turns, 150)
+    while len(game.history):
+        assert fsm.rewind(game) == 1
+        assert state(game) == before[game.turns][1]
+        expected = set(game.mobs) | {(game.player_x, game.player_y), (game.exit_x, game.exit_y)}
+        assert game.occupied_coords == expected
+    # Taking the same moves again plays out the same way.
+    for move in moves[before[game.turns][0]:]:
+        handler.maybe_move(*move)
+    assert state(game) == final
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_rewind_many_turns_and_replay(console, seed):
+    config = GameConfig(mobs=60, player_hp=1000)
+    game = fsm.build_game(console, console, seed=seed, config=config, history=History(100))
+    handler, moves, before = play_rewindable(game, 150, seed)
+    final, turns = state(game), game.turns
+    assert fsm.rewind(game, 50) == min(turns, 50)
+    assert state(game) == before[game.turns][1]
+    for move in moves[before[game.turns][0]:]:
+        handler.maybe_move(*move)
+    assert state(game) == final
+
+
+# Seeds whose player is still on the first level after 30 turns.
+@pytest.mark.parametrize('seed', [0, 1, 4])
+@pytest.mark.parametrize('between', ['compactions', 'levels', 'rewinds'])
+def test_recover_before_base_is_written(console, tmp_path, monkeypatch, seed, between):
+    journal = Journal(str(tmp_path), compact_every=20 if between == 'compactions' else 1000)
+    # Crash, in effect, before any base after the first one is written.
+    put = journal._queue.put
+    monkeypatch.setattr(journal._queue, 'put', lambda item: put(item) if item is None or item[0] == 1 else None)
+    config = GameConfig(mobs=60, player_hp=1000, levels=2)
+    game = fsm.build_game(console, console, seed=seed, config=config, journal=journal, history=History(50))
+    handler = play(game, 30, seed)
+    assert game.level == 0
+    expected = fsm.game_hash(game), game.rng.get_state()
+    if between == 'levels':
+        handler.change_level(1)
+    elif between == 'rewinds':
+        fsm.rewind(game, 5)
+    play(game, 60, seed + 1)
+    if between == 'compactions':
+        expected = fsm.game_hash(game), game.rng.get_state()
+    journal.close()
+    assert not (tmp_path / 'base-2.pmsv').exists()
+    recovered = fsm.recover_game(str(tmp_path), console, console)
+    assert (fsm.game_hash(recovered), recovered.rng.get_state()) == expected
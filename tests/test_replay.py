@@ -0,0 +1,57 @@
+"""
+A recorded session replays headlessly to the state it was recorded in.
+"""
+import numpy as np
+import pytest
+import tcod.event
+
+import fsm
+from config import GameConfig
+from recording import Recorder
+from replay import replay
+
+KEYS = [
+    tcod.event.SCANCODE_H,
+    tcod.event.SCANCODE_J,
+    tcod.event.SCANCODE_K,
+    tcod.event.SCANCODE_L,
+    tcod.event.SCANCODE_D,
+    tcod.event.SCANCODE_C,
+    tcod.event.SCANCODE_O,
+    tcod.event.SCANCODE_X,
+    tcod.event.SCANCODE_PERIOD,
+    tcod.event.SCANCODE_S,
+    tcod.event.SCANCODE_R,
+]
+
+
+def script(seed: int, length: int):
+    """Random key presses, one per batch, some with shift held (to run, or for >)."""
+    rng = np.random.default_rng(seed)
+    for _ in range(length):
+        mod = tcod.event.KMOD_LSHIFT if rng.random() < 0.2 else 0
+        # Explore and head for the exit often enough to take the stairs.
+        scancode = rng.choice([tcod.event.SCANCODE_O, tcod.event.SCANCODE_X] if rng.random() < 0.6 else KEYS)
+        yield [tcod.event.KeyDown(scancode=int(scancode), sym=0, mod=mod)]
+
+
+# Seeds whose multi-level session takes the stairs.
+@pytest.mark.parametrize('seed', [0, 4, 8])
+@pytest.mark.parametrize('config', [
+    GameConfig(),
+    GameConfig(levels=3, doors=10, mob_sight=5, player_hp=100),
+], ids=['plain', 'levels'])
+def test_replay_matches_recording(console, tmp_path, config, seed):
+    path = str(tmp_path / 'session.pmrl')
+    game = fsm.build_game(console, console, backend=fsm.HeadlessBackend(script(seed, 600)), seed=seed, config=config)
+    game.recorder = Recorder(path, game.rng.seed, game.config)
+    machine = fsm.run_fsm(fsm.STATE_HANDLERS, fsm.State.MAP, game)
+    recorded = fsm.game_hash(machine.game)
+    if config.levels > 1:
+        assert machine.game.level > 0
+    game.recorder.close(recorded)
+    # The recording's configuration is used, not the default.
+    replayed, expected = replay(path)
+    assert expected == recorded
+    assert fsm.game_hash(replayed) == recorded
+    assert replayed.config == config
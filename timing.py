@@ -0,0 +1,111 @@
+"""
+Per-phase timing of the game loop, e.g. input dispatch, maybe_move,
+compute_fov, draw_map and flushing to the screen.
+
+Samples are kept in a fixed-size ring per phase, so percentiles always
+describe the last few hundred frames rather than the whole session.
+"""
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+from typing import Callable, Deque, Dict, Iterator, List, Tuple
+
+import numpy as np
+import tcod
+
+
+class Timings:
+
+    def __init__(self, window: int = 500) -> None:
+        self.enabled = False  # whether samples are being taken
+        self.overlay = False  # whether they are drawn over the game
+        self.collecting = False  # taken whether or not they are drawn, e.g. for export
+        self.window = window  # number of recent samples kept per phase
+        self.samples: Dict[str, Deque[float]] = {}
+
+    def collect(self) -> None:
+        """Take samples from now on, whether or not the overlay is shown."""
+        self.collecting = self.enabled = True
+
+    def toggle(self) -> None:
+        """Show or hide the overlay. Samples are taken while it is shown."""
+        self.overlay = not self.overlay
+        if self.overlay and not self.enabled:
+            self.samples.clear()
+        self.enabled = self.overlay or self.collecting
+
+    def record(self, phase: str, seconds: float) -> None:
+        samples = self.samples.get(phase)
+        if samples is None:
+            samples = self.samples[phase] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    @contextmanager
+    def _measure(self, phase: str) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, perf_counter() - start)
+
+    def phase(self, phase: str):
+        """Context manager that times its body if timing is enabled."""
+        if not self.enabled:
+            return _NOT_TIMING
+        return self._measure(phase)
+
+    def percentiles(self, phase: str) -> Tuple[float, float, float]:
+        """Return p50, p95 and p99 of the recent samples, in seconds."""
+        samples = self.samples.get(phase)
+        if not samples:
+            return 0.0, 0.0, 0.0
+        p50, p95, p99 = np.percentile(np.fromiter(samples, dtype=float), [50, 95, 99])
+        return float(p50), float(p95), float(p99)
+
+    def report(self) -> List[str]:
+        lines = [f'{"phase":<11}{"p50":>6}{"p95":>6}{"p99":>6}']
+        for phase in self.samples:
+            p50, p95, p99 = (t * 1000 for t in self.percentiles(phase))
+            lines.append(f'{phase:<11}{p50:6.2f}{p95:6.2f}{p99:6.2f}')
+        return lines
+
+
+class _NotTiming:
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NOT_TIMING = _NotTiming()
+
+
+def timed(phase: str) -> Callable:
+    """Time a handler method under the given phase name via self.game.timings."""
+    def decorator(method: Callable) -> Callable:
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            timings = self.game.timings
+            if not timings.enabled:
+                return method(self, *args, **kwargs)
+            start = perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                timings.record(phase, perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def draw_timings(console: tcod.console.Console, timings: Timings) -> None:
+    # Overlay a bordered pane in the top right corner; times are milliseconds.
+    lines = timings.report()
+    width = 32
+    height = len(lines) + 4
+    x = console.width - width
+    console.draw_frame(x, 0, width, height, title='Timings (ms)', clear=True)
+    for i, line in enumerate(lines):
+        console.print(x + 2, 2 + i, line)
@@ -0,0 +1,153 @@
+"""
+Running and traveling: taking many turns for one command.
+
+Turns are simulated back to back without drawing, and stop as soon as
+something interesting happens: a mob comes into view, the player is hurt,
+the way forks or is blocked, or the state or level changes (e.g. reaching
+the exit).
+Only the final state is drawn, unless a throttled animation is asked for.
+"""
+from time import perf_counter
+from typing import Callable, List, Optional, Set, Tuple
+
+import numpy as np
+import tcod
+import tcod.path
+
+# Upper bound on turns per command, so a bad path can't hang the game.
+MAX_AUTO_STEPS = 1000
+
+DIRECTIONS = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+
+Step = Tuple[int, int]
+
+
+def mobs_near(game, radius: int) -> List[Tuple[int, int]]:
+    """Coordinates of the mobs within radius tiles (in x and y) of the player."""
+    x0 = max(game.player_x - radius, 0)
+    x1 = min(game.player_x + radius + 1, game.map_width)
+    y0 = max(game.player_y - radius, 0)
+    y1 = min(game.player_y + radius + 1, game.map_height)
+    if (x1 - x0) * (y1 - y0) < len(game.mobs):
+        # Fewer tiles than mobs, so look the tiles up instead.
+        return [(x, y) for y in range(y0, y1) for x in range(x0, x1) if (x, y) in game.mobs]
+    return [(x, y) for x, y in game.mobs if x0 <= x < x1 and y0 <= y < y1]
+
+
+def visible_mobs(game) -> Set[Tuple[int, int]]:
+    fov = game.fov
+    if np.count_nonzero(fov.visible) < len(game.mobs):
+        # Fewer tiles in view than mobs, so look the tiles up instead.
+        ys, xs = np.nonzero(fov.visible)
+        return {coords for coords in zip((xs + fov.x).tolist(), (ys + fov.y).tolist()) if coords in game.mobs}
+    return {coords for coords in game.mobs if coords in fov}
+
+
+def auto_move(
+        handler,
+        next_step: Callable[[], Optional[Step]],
+        animate_every: Optional[float] = None
+) -> str:
+    """
+    Keep taking the steps next_step() returns until it returns None or
+    something interrupts. Returns why the player stopped.
+    """
+    game = handler.game
+    state = handler.next_state
+    level = game.level
+    seen = visible_mobs(game)
+    last_frame = perf_counter()
+    for _ in range(MAX_AUTO_STEPS):
+        step = next_step()
+        if step is None:
+            return 'arrived'
+        dx, dy = step
+        _, action_type, _ = handler.check_move(
+            game.player_x,
+            game.player_y,
+            dx,
+            dy,
+            allow_attack=True
+        )
+        # Never attack or bump into things on autopilot, though doors in the
+        # way are opened.
+        if action_type not in ('move', 'open'):
+            return 'blocked'
+        hp = game.player_hp
+        handler.maybe_move(dx, dy)
+        if handler.next_state != state:
+            return 'state'
+        if game.level != level:
+            return 'level'
+        if game.player_hp < hp:
+            return 'damage'
+        now_seen = visible_mobs(game)
+        if now_seen - seen:
+            game.messages.append('You see an orc.')
+            return 'mob'
+        seen = now_seen
+        if animate_every is not None and perf_counter() - last_frame >= animate_every:
+            handler.render()
+            last_frame = perf_counter()
+    return 'limit'
+
+
+def walkable_neighbors(game, back: Step) -> Set[Step]:
+    walkable = game.fov_map.walkable
+    openings = set()
+    for dx, dy in DIRECTIONS:
+        x = game.player_x + dx
+        y = game.player_y + dy
+        if (dx, dy) != back and 0 <= x < game.map_width and 0 <= y < game.map_height:
+            if walkable[y, x]:
+                openings.add((dx, dy))
+    return openings
+
+
+def run(handler, dx: int, dy: int, animate_every: Optional[float] = None) -> str:
+    """Move in one direction until blocked or the layout around us changes."""
+    game = handler.game
+    back = -dx, -dy
+    openings = None
+
+    def next_step() -> Optional[Step]:
+        nonlocal openings
+        now_openings = walkable_neighbors(game, back)
+        # Side passages opening or closing mean a fork or a room edge.
+        if openings is not None and now_openings != openings:
+            return None
+        openings = now_openings
+        return dx, dy
+
+    return auto_move(handler, next_step, animate_every)
+
+
+def find_path(game, x: int, y: int) -> Optional[List[Step]]:
+    """Shortest path over remembered floor to (x, y), as (x, y) tiles."""
+    if not (0 <= x < game.map_width and 0 <= y < game.map_height):
+        return None
+    if not game.memory[y, x]:
+        return None
+    cost = (game.fov_map.walkable & game.memory.to_array()).astype(np.int8)
+    astar = tcod.path.AStar(cost, diagonal=0)
+    path = astar.get_path(game.player_y, game.player_x, y, x)
+    if not path:
+        return None
+    return [(path_x, path_y) for path_y, path_x in path]
+
+
+def travel(handler, x: int, y: int, animate_every: Optional[float] = None) -> str:
+    game = handler.game
+    path = find_path(game, x, y)
+    if path is None:
+        game.messages.append("You don't know a way there.")
+        return 'no path'
+    steps = iter(path)
+
+    def next_step() -> Optional[Step]:
+        to_x, to_y = next(steps, (game.player_x, game.player_y))
+        if (to_x, to_y) == (game.player_x, game.player_y):
+            return None
+        return to_x - game.player_x, to_y - game.player_y
+
+    return auto_move(handler, next_step, animate_every)